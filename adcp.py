@@ -10,8 +10,7 @@ from constants import (TIMEZONE, ADCP_DATES, DATES_FORMAT,
                        CALM_TIDES, STORM_TIDES, ADCP_LEVELS)
 from datetime import datetime
 from pandas.plotting import register_matplotlib_converters
-from intervals import STORM_INTERVALS, CALM_INTERVALS
-from tools import station, plotter
+from tools import masks, station, plotter, tides
 
 
 register_matplotlib_converters()
@@ -85,17 +84,10 @@ class ADCP(object):
         """
         Plot mean values for the given component by STORM and CALM intervals
         """
-        intervals = STORM_INTERVALS["S%d Bedframe" % self.site]
         df = self.df.groupby(level=0).mean()[["Vel_N_TN", "Vel_E_TN"]]
         df = df.join(self.wd, how="left")
-        sdf = pd.DataFrame()
-        for interval in intervals:
-            sdf = sdf.append(df[interval[0]:interval[1]])
-
-        intervals = CALM_INTERVALS["S%d Bedframe" % self.site]
-        cdf = pd.DataFrame()
-        for interval in intervals:
-            cdf = cdf.append(df[interval[0]:interval[1]])
+        sdf = masks.select(df, "storm", "S%d Bedframe" % self.site)
+        cdf = masks.select(df, "calm", "S%d Bedframe" % self.site)
 
         vmax = max(sdf[component].abs().max(), cdf[component].abs().max())
         vmin = -vmax
@@ -162,20 +154,11 @@ class ADCP(object):
 
     def _set_tide(self):
         """
-        Calculate trend of tide Ebb/Flood depending on next row's depth.
+        Tidal phase (trend of tide Ebb/Flood, tidal cycle and hours from
+        high water, see tools.tides) of the water depth.
         Assuming "WaterDepth" as depth var name
         """
-        if "Tide" not in self.wd:
-            self.wd["Tide"] = np.where(
-                self.wd["WaterDepth"] > self.wd["WaterDepth"].shift(-1),
-                "Ebb",
-                "Flood")
-        # last row doesn't have a next, compare with previous row
-        last_rows = self.wd.tail(2)
-        if last_rows.iloc[0].WaterDepth > last_rows.iloc[1].WaterDepth:
-            self.wd.at[self.wd.index[-1], "Tide"] = "Ebb"
-        else:
-            self.wd.at[self.wd.index[-1], "Tide"] = "Flood"
+        tides.set_tidal_columns(self.wd, "WaterDepth")
 
 
 class RDI(ADCP):
@@ -0,0 +1,322 @@
+import dispersion
+import fourier
+import logging
+import numpy as np
+import pandas as pd
+import peakutils
+from burst import BurstFourier, BurstWelch, BurstPeaks, BurstStats
+from scipy.constants import pi as PI
+from scipy import signal
+
+
+BURSTS = {
+    "fourier": BurstFourier,
+    "welch": BurstWelch,
+    "peaks": BurstPeaks
+}
+
+
+def pack_bursts(ids, values, sr):
+    r"""
+    Locate valid bursts in a time-sorted array of samples.
+
+    Only the first sr samples of each burst are kept. Bursts with less than
+    sr/2 samples or any NaN value are discarded (see Device.get_burst).
+
+    Parameters
+    ----------
+    ids : array_like
+        Burst number of each sample, sorted
+    values : numpy.ndarray
+        2-D array (samples x variables) checked for NaN values
+    sr : int
+        Sampling rate (samples per burst)
+
+    Returns
+    -------
+    (bids, offsets, lengths) arrays for valid bursts, offsets and lengths
+    being positions in values.
+    """
+    ids = np.asarray(ids)
+    if len(ids) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    bids, offsets, counts = np.unique(
+        ids, return_index=True, return_counts=True)
+    lengths = np.minimum(counts, sr)
+    nan_rows = np.isnan(values).reshape(len(ids), -1).any(axis=1)
+    nan_cumsum = np.concatenate([[0], np.cumsum(nan_rows)])
+    nans = nan_cumsum[offsets + lengths] - nan_cumsum[offsets]
+    valid = (lengths >= (sr / 2)) & (nans == 0)
+    return bids[valid], offsets[valid], lengths[valid]
+
+
+def stack_bursts(values, offsets, length):
+    """
+    2-D (n_bursts x length) view of values for bursts starting at offsets
+    """
+    rows = np.asarray(offsets)[:, None] + np.arange(length)
+    return values[rows]
+
+
+def suppress_peaks(y, peaks, min_dist):
+    """
+    Peaks of y kept at least min_dist samples apart, highest first: each
+    kept peak removes the lower peaks within min_dist on each side (as
+    peakutils.indexes does)
+    """
+    highest = peaks[np.argsort(y[peaks])][::-1]
+    removed = np.ones(len(y), dtype=bool)
+    removed[peaks] = False
+    for peak in highest:
+        if not removed[peak]:
+            removed[max(0, peak - min_dist):peak + min_dist + 1] = True
+            removed[peak] = False
+    return np.flatnonzero(~removed)
+
+
+def peak_distances(x, thres=None, min_dist=10):
+    r"""
+    Mean distance [samples] between peaks of each burst (row) of x, NaN if
+    a burst has less than two peaks. Same peaks as peakutils.indexes
+    (see BurstPeaks): local maxima above thres found for all bursts at
+    once, then lower peaks closer than min_dist to a higher one removed
+    per burst (see suppress_peaks). Bursts with flat stretches are left
+    to peakutils.indexes, as it handles plateaus its own way.
+
+    Parameters
+    ----------
+    x : array_like
+        2-D (n_bursts x burst_samples) signal
+    thres : array_like
+        absolute threshold per burst, bursts mean if None
+    min_dist : int
+        minimum distance between peaks [samples]
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    if thres is None:
+        thres = x.mean(axis=1)
+    thres = np.broadcast_to(np.asarray(thres, dtype=float), (len(x),))
+    dy = np.diff(x, axis=1)
+    peaks = np.zeros(x.shape, dtype=bool)
+    peaks[:, 1:-1] = ((dy[:, :-1] > 0) & (dy[:, 1:] < 0) &
+                      (x[:, 1:-1] > thres[:, None]))
+    flat = (dy == 0).any(axis=1)
+    distances = np.full(len(x), np.nan)
+    for i in range(len(x)):
+        if flat[i]:
+            rows = peakutils.indexes(x[i], thres=thres[i],
+                                     min_dist=min_dist, thres_abs=True)
+        else:
+            rows = np.flatnonzero(peaks[i])
+            if len(rows) > 1 and min_dist > 1:
+                rows = suppress_peaks(x[i], rows, min_dist)
+        if len(rows) > 1:
+            distances[i] = (rows[-1] - rows[0]) / (len(rows) - 1)
+    return distances
+
+
+def calc_chunk(values, t, tz, columns, offsets, lengths, f, z, device,
+               method="welch", batch=False, nperseg=None):
+    r"""
+    Calculates U, T and H for a chunk of bursts. Runs in a worker process
+    (see Device._calc_bursts), so it only takes plain numpy arrays.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2-D (samples x columns) chunk of the hydrostatic burst dataframe
+    t : numpy.ndarray
+        int64 UTC timestamps [ns] of values
+    tz : datetime.tzinfo
+        timezone of the original dataframe index
+    columns : list
+        column names of values
+    offsets, lengths : numpy.ndarray
+        position and number of samples of each burst in values
+    f : int
+        Signal frequency [Hz]
+    z : float
+        elevation of instrument over seabed
+    device : str
+        device name, for logging
+    method : str
+        'welch', 'fourier' or 'peaks'
+    batch : bool
+        analyse bursts with BurstBatch instead of one Burst each
+    nperseg : int
+        Welch segment length for BurstBatch
+
+    Returns
+    -------
+    2-D array (n_bursts x 3) of u, T and H
+    """
+    uth = np.full((len(offsets), 3), np.nan)
+    if batch:
+        hydro_depth = values[:, columns.index("hydro_depth")]
+        for length in np.unique(lengths):
+            sel = lengths == length
+            ts = (t[offsets[sel] + length - 1] - t[offsets[sel]]) // 10**9
+            burst_batch = BurstBatch(
+                stack_bursts(hydro_depth, offsets[sel], length),
+                None, f, z, method=method, nperseg=nperseg, ts=ts)
+            uth[sel] = burst_batch.get_UTH().values
+            if not burst_batch.converged.all():
+                logging.getLogger(device).warning(
+                    "L not converged for %d bursts of %s",
+                    (~burst_batch.converged).sum(),
+                    str(burst_batch))
+        return uth
+    index = pd.to_datetime(t, utc=True)
+    if tz is not None:
+        index = index.tz_convert(tz)
+    else:
+        index = index.tz_localize(None)
+    for i, (offset, length) in enumerate(zip(offsets, lengths)):
+        df = pd.DataFrame(
+            values[offset:offset + length],
+            index=index[offset:offset + length],
+            columns=columns)
+        burst = BURSTS.get(method, BurstPeaks)(df, df.index, f, z, device)
+        uth[i] = burst.get_UTH()
+    return uth
+
+
+class BurstBatch(object):
+    r"""
+    Represents a batch of RbR Concerto bedframe bursts of the same length,
+    analysed at once along axis 1. Same calculations as burst.Burst.
+
+    Parameters
+    ----------
+    hydro_depth : numpy.ndarray
+        2-D (n_bursts x burst_samples) hydrostatic depth [m]
+    t : array_like, pandas.DatetimeIndex
+        burst start times
+    f : int
+        Signal frequency [Hz]
+    z : float
+        elevation of instrument over seabed
+    method : str
+        'welch', 'fourier' or 'peaks'
+    nperseg : int
+        Welch segment length, burst_samples/8 if None
+    ts : array_like
+        Burst durations [s] (whole seconds, as Burst.ts), from
+        burst_samples and f if None
+    """
+
+    METHODS = ["welch", "fourier", "peaks"]
+
+    def __init__(self, hydro_depth, t, f, z, method="welch", nperseg=None,
+                 ts=None):
+        if method not in self.METHODS:
+            raise ValueError("Unknown batch method %s" % method)
+        self.hydro_depth = np.atleast_2d(np.asarray(hydro_depth, dtype=float))
+        self.t = t
+        self.f = f
+        self.rate = 1/f
+        self.n, self.sr = self.hydro_depth.shape
+        self.z = z
+        self.method = method
+        self.nperseg = int(self.sr/8) if nperseg is None else int(nperseg)
+        if ts is None:
+            ts = int((self.sr - 1) * self.rate)
+        self.ts = np.broadcast_to(np.asarray(ts, dtype=float), (self.n,))
+        self.stats = BurstStats(self.hydro_depth)
+        self.hydro_depth_dt = self.stats.detrended
+        self.hd_mean = self.stats.mean
+        self.hd_sd = self.stats.sd
+        if self.n == 0:
+            self.T = self.L = self.K = self.H = self.U = np.array([])
+            self.converged = np.array([], dtype=bool)
+            return
+        if method == "welch":
+            self._calc_T_welch()
+        elif method == "fourier":
+            self._calc_T_fourier()
+        else:
+            self._calc_T_peaks()
+        self._calc_L()
+        self._calc_K()
+        self._calc_H()
+        self._calc_U()
+
+    def _calc_T_welch(self):
+        """
+        Apply scipy.signal.welch to every detrended burst (see BurstWelch)
+        """
+        self.freqs, self.pwr = signal.welch(
+            self.hydro_depth_dt,
+            self.f,
+            nperseg=self.nperseg,
+            axis=1)
+        idx = np.argmax(np.abs(self.pwr), axis=1)
+        self.pf = self.freqs[idx]  # peak freq
+        self.T = 1/self.pf
+
+    def _calc_T_fourier(self):
+        """
+        Real FFT of every detrended and windowed burst
+        (see BurstFourier and fourier.Spectrum)
+        """
+        spectrum = fourier.Spectrum(self.hydro_depth_dt, self.f)
+        self.freqs = spectrum.freqs
+        self.pwr = spectrum.pwr
+        self.pf = spectrum.pf  # peak freq
+        self.T = 1/self.pf
+
+    def _calc_T_peaks(self):
+        """
+        Average period between peaks of every burst (see BurstPeaks and
+        peak_distances)
+        """
+        mean_period = np.round(
+            peak_distances(self.hydro_depth, self.hd_mean, min_dist=10), 2)
+        self.T = (mean_period / self.sr) * self.ts
+        self.pf = 1/self.T
+
+    def _calc_L(self):
+        """
+        Calculates lambda from the dispersion relation for every burst
+        (see dispersion.solve)
+        """
+        self.L, k, self.converged = dispersion.solve(self.T, self.hd_mean)
+
+    def _calc_K(self):
+        """
+        Math: K = (2*PI) / lambda
+        """
+        self.K = np.round((2 * PI) / self.L, 2)
+
+    def _calc_H(self):
+        """
+        Math: H = 4hSD * (cosh(k*h)/cosh[z* + h])
+        """
+        self.H = 4 * self.hd_sd * ((np.cosh(self.K * self.hd_mean) /
+                                    np.cosh(self.K * (self.z + self.hd_mean))))
+
+    def _calc_U(self):
+        """
+        Significant orbital speed at the bed U [cm/s]
+        """
+        n = (4 * PI * self.hd_sd * np.cosh(self.K * self.hd_mean))
+        d = (self.T * np.cosh(self.K * (self.z + self.hd_mean)) *
+             np.sinh(self.K * self.hd_mean))
+        self.U = (n / d) * 100
+
+    def __len__(self):
+        return self.n
+
+    def __str__(self):
+        return ("Batch of %d bursts") % self.n
+
+    def unicode(self):
+        return self.__str__()
+
+    def get_UTH(self):
+        """ pandas.DataFrame of u, T and H indexed by burst start time """
+        return pd.DataFrame(
+            {"u": self.U, "T": self.T, "H": self.H},
+            index=self.t,
+            columns=["u", "T", "H"])
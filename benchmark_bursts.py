@@ -0,0 +1,209 @@
+import fire
+import logging
+import numpy as np
+import pandas as pd
+import time
+import tracemalloc
+
+import dispersion
+from burst import calc_density
+from constants import TIMEZONE, Z_ELEVATION
+from tools import encoder  # noqa: F401, imports device (circular imports)
+from device import Device
+from scipy.constants import pi as PI
+from scipy.constants import g as G
+
+
+FREQ = 6  # Hz, as the Concertos
+INTERVAL = 600  # s between start of each burst
+START = "2017-05-10 00:00:00"
+TIDAL_PERIOD = 12.42 * 3600  # s, M2
+
+
+def synthetic_deployment(n_bursts, sr=2048, f=FREQ, i=INTERVAL, seed=0,
+                         noise=0.001):
+    r"""
+    Seeded synthetic bedframe deployment: n_bursts bursts of sr samples of
+    pressure, salinity and temperature (plus depth and turbidity, as the
+    Concerto files), each burst a monochromatic wave of known period and
+    height riding a semidiurnal tide.
+
+    Parameters
+    ----------
+    n_bursts : int
+        Number of bursts
+    sr : int
+        Sampling rate (samples per burst)
+    f : int
+        Signal frequency [Hz]
+    i : int
+        Interval between bursts [s]
+    seed : int
+        Random generator seed
+    noise : float
+        Standard deviation of the white noise added to the depth [m]
+
+    Returns
+    -------
+    (df, truth): raw data as Device.df and pandas.DataFrame of the
+    expected u, T, H and mean hydrostatic depth h, indexed by burst start.
+    """
+    rng = np.random.RandomState(seed)
+    z = Z_ELEVATION
+    start = pd.Timestamp(START, tz=TIMEZONE)
+    offsets = np.round(np.arange(sr) * 10**9 / f).astype(np.int64)
+    t0 = start.value + np.arange(n_bursts, dtype=np.int64) * i * 10**9
+    t = t0[:, None] + offsets  # n_bursts x sr [ns]
+    ts = (t - start.value) / 10**9  # [s] from deployment start
+    tmid = ts.mean(axis=1)
+
+    # tide: burst mean depth and linear trend within the burst
+    w_tide = 2 * PI / TIDAL_PERIOD
+    h = 2.5 + 1.5 * np.sin(w_tide * tmid)
+    slope = 1.5 * w_tide * np.cos(w_tide * tmid)
+    T = rng.uniform(3, 12, n_bursts)
+    H = rng.uniform(0.05, 0.5, n_bursts)
+    phase = rng.uniform(0, 2 * PI, n_bursts)
+
+    # amplitude at the sensor so that 4 * sd of the burst gives H
+    # (see burst.Burst._calc_H), and expected U (see burst.Burst._calc_U)
+    L = dispersion.wavelength(T, h)
+    k = 2 * PI / L
+    ratio = np.cosh(k * h) / np.cosh(k * (z + h))
+    sd = H / (4 * ratio)
+    u = ((4 * PI * sd * np.cosh(k * h)) /
+         (T * np.cosh(k * (z + h)) * np.sinh(k * h))) * 100
+
+    dt = ts - tmid[:, None]
+    depth = (h[:, None] + slope[:, None] * dt +
+             np.sqrt(2) * sd[:, None] *
+             np.sin(2 * PI * dt / T[:, None] + phase[:, None]) +
+             noise * rng.standard_normal(t.shape))
+    salinity = (33 + 0.5 * np.sin(w_tide * ts) +
+                0.01 * rng.standard_normal(t.shape))
+    temperature = 14 + 0.2 * rng.standard_normal(t.shape)
+    # seapressure [dbar] of the hydrostatic depth, density per burst
+    # (see device.Device.get_hydrostatic_df)
+    density = calc_density(salinity, temperature,
+                           ((depth - z) * 1025 * G) / 10000)
+    pressure = ((depth - z) * density.mean(axis=1)[:, None] * G) / 10000
+
+    index = pd.to_datetime(t.ravel(), utc=True).tz_convert(TIMEZONE)
+    df = pd.DataFrame({
+        "salinity_00": salinity.ravel(),
+        "temperature_00": temperature.ravel(),
+        "seapressure_00": pressure.ravel(),
+        "depth_00": depth.ravel(),
+        "turbidity_00": np.abs(rng.normal(20, 5, t.size))},
+        index=index)
+    truth = pd.DataFrame(
+        {"u": u, "T": T, "H": H, "h": h},
+        index=pd.to_datetime(t0, utc=True).tz_convert(TIMEZONE),
+        columns=["u", "T", "H", "h"])
+    return df, truth
+
+
+class SyntheticDevice(Device):
+    r"""
+    Bedframe Device on a synthetic deployment (see synthetic_deployment),
+    all of it valid data
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Raw data
+    sr : int
+        Sampling rate (samples per burst)
+    workers : int
+        Number of processes to calculate bursts with, serial if None
+    """
+
+    def __init__(self, df, sr, workers=None):
+        self.df_synthetic = df
+        super(SyntheticDevice, self).__init__(
+            "SYN", "bedframe", "synthetic", FREQ, sr, INTERVAL, [0, 1],
+            [0, 1], "h5", workers=workers)
+
+    def _init_logger(self):
+        self.logger = logging.getLogger(str(self))
+
+    def _load_df(self):
+        self.df = self.df_synthetic
+        self._set_vars()
+
+    def _load_df_avg(self):
+        self.df_avg = self.clean_df(self.df)
+
+    def get_data_mask(self, index):
+        return np.ones(len(index), dtype=bool)
+
+
+def accuracy(result, truth):
+    """
+    Median absolute relative error of u, T and H and share of bursts
+    calculated
+    """
+    result = result.reindex(truth.index)
+    acc = {}
+    for v in ["u", "T", "H"]:
+        err = np.abs(result[v].values - truth[v].values) / truth[v].values
+        acc["%s_err" % v] = np.nanmedian(err)
+    acc["valid"] = result["T"].notna().mean()
+    return acc
+
+
+def bench(n_bursts, sr, method="welch", batch=False, workers=None, seed=0):
+    """
+    Time Device._calc_bursts on a synthetic deployment
+
+    Returns a dict of throughput, peak memory (main process, traced by
+    tracemalloc) and accuracy
+    """
+    df, truth = synthetic_deployment(n_bursts, sr=sr, seed=seed)
+    device = SyntheticDevice(df, sr, workers=workers)
+    tracemalloc.start()
+    t = time.perf_counter()
+    device._calc_bursts(method=method, batch=batch, workers=workers)
+    elapsed = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    res = {
+        "bursts": n_bursts,
+        "samples": sr,
+        "method": method,
+        "batch": batch,
+        "workers": workers or 1,
+        "seconds": elapsed,
+        "bursts_s": n_bursts / elapsed,
+        "peak_MB": peak / 2**20}
+    res.update(accuracy(device.df_avg[["u", "T", "H"]], truth))
+    return res
+
+
+def run(sizes=(100, 1000, 10000), samples=(1024, 2048),
+        methods=("welch", "fourier", "peaks"), batch=(False, True),
+        workers=None, seed=0, output=None):
+    """
+    Benchmark the burst calculations for all combinations of deployment
+    sizes (bursts), burst sizes (samples), methods and batch modes.
+    Prints a table, saved as csv in output if given.
+
+    $ python benchmark_bursts.py --sizes=[100,50000] --methods=[welch]
+    """
+    results = []
+    for n_bursts in sizes:
+        for sr in samples:
+            for method in methods:
+                for b in batch:
+                    results.append(bench(n_bursts, sr, method=method,
+                                         batch=b, workers=workers,
+                                         seed=seed))
+                    print(results[-1])
+    df = pd.DataFrame(results, columns=list(results[0].keys()))
+    print(df.to_string(float_format="%.4g"))
+    if output is not None:
+        df.to_csv(output, index=False)
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
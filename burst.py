@@ -1,3 +1,5 @@
+import dispersion
+import fourier
 import gsw
 import logging
 import matplotlib.pyplot as plt
@@ -8,7 +10,64 @@ import pandas as pd
 import seaborn as sns
 from scipy.constants import pi as PI
 from scipy.constants import g as G
-from scipy import fftpack, signal
+from scipy import signal
+
+
+def calc_density(salinity, temperature, pressure):
+    """
+    Calculates density from Sal, Temp, Pressure arrays in a single
+    vectorized call.
+
+    http://www.teos-10.org/pubs/gsw/html/rho.html
+    """
+    return gsw.density.rho(np.asarray(salinity, dtype=float),
+                           np.asarray(temperature, dtype=float),
+                           np.asarray(pressure, dtype=float))
+
+
+def calc_hydrostatic_depth(pressure, density_mean, z):
+    """
+    Calculates hydrostatic depth from raw pressure arrays.
+    Green & Coco (2017)
+    Math: h(t) = ((p(t) - pa)/ dens * G) + zp
+    Note: pressure in Pascals (1dbar = 10000 P)
+    """
+    pressure = np.asarray(pressure, dtype=float)
+    return ((pressure * 10000) / (density_mean * G)) + z
+
+
+class BurstStats(object):
+    r"""
+    Statistics of one burst (1-D) or a stack of bursts (2-D, one burst
+    per row), calculated at once along the last axis of x: number of
+    samples, NaN count, mean, variance (ddof=1), min, max, and the linear
+    trend and detrended series (least squares, as scipy.signal.detrend).
+    NaN values propagate to every statistic but nans.
+
+    Parameters
+    ----------
+    x : array_like
+        Burst samples, e.g. hydrostatic depth [m]
+    """
+    __slots__ = ["n", "nans", "mean", "var", "min", "max", "slope",
+                 "detrended"]
+
+    def __init__(self, x):
+        x = np.asarray(x, dtype=float)
+        self.n = x.shape[-1]
+        self.nans = np.isnan(x).sum(axis=-1)
+        self.mean = x.mean(axis=-1)
+        self.min = x.min(axis=-1)
+        self.max = x.max(axis=-1)
+        xc = x - self.mean[..., None]
+        self.var = (xc * xc).sum(axis=-1) / (self.n - 1)
+        tc = np.arange(self.n) - (self.n - 1) / 2
+        self.slope = (xc * tc).sum(axis=-1) / (tc * tc).sum()
+        self.detrended = xc - self.slope[..., None] * tc
+
+    @property
+    def sd(self):
+        return np.sqrt(self.var)
 
 
 class Burst(object):
@@ -27,7 +86,13 @@ class Burst(object):
         Signal frequency [Hz]
     z : float
         elevation of instrument over seabed
+    device : str
+        device name, for logging
+
+    Note: if df already carries "density" and "hydro_depth" columns
+    (precomputed for the whole deployment by Device) they are used as is.
     """
+    METHOD = None
 
     def __init__(self, df, t, f, z, device):
         self.device = device
@@ -62,12 +127,11 @@ class Burst(object):
 
         http://www.teos-10.org/pubs/gsw/html/rho.html
         """
-        self.df["density"] = self.df.apply(
-            lambda r:  gsw.density.rho(
-                r.salinity_00,
-                r.temperature_00,
-                r.seapressure_00),
-            axis=1)
+        if "density" not in self.df.columns:
+            self.df["density"] = calc_density(
+                self.df.salinity_00.values,
+                self.df.temperature_00.values,
+                self.df.seapressure_00.values)
 
     def _calc_hydrostatic_depth(self):
         """
@@ -76,17 +140,17 @@ class Burst(object):
         Math: h(t) = ((p(t) - pa)/ dens * G) + zp
         Note: pressure in Pascals (1dbar = 10000 P)
         """
-        density_mean = self.df.density.mean()
-        self.df["hydro_depth"] = self.df.apply(
-            lambda r: ((r.seapressure_00*10000) / (density_mean * G)) + self.z,
-            axis=1)
-        self.df["hydro_depth_dt"] = signal.detrend(
-                                        self.df.hydro_depth,
-                                        type="linear")
+        if "hydro_depth" not in self.df.columns:
+            self.df["hydro_depth"] = calc_hydrostatic_depth(
+                self.df.seapressure_00.values,
+                self.df.density.mean(),
+                self.z)
+        self.stats = BurstStats(self.df.hydro_depth.values)
+        self.df["hydro_depth_dt"] = self.stats.detrended
 
     def _calc_L(self):
         """
-        Iteratively calculates lambda from the dispersion relation.
+        Calculates lambda from the dispersion relation (see dispersion.solve)
 
         Math: lambda = (G / 2*PI) * T^2 * tanh(2*PI*h/lambda)
         https://en.wikipedia.org/wiki/Dispersion_(water_waves)
@@ -96,20 +160,12 @@ class Burst(object):
                              str(self.sr),
                              round(self.pp, 2))
         self.logger.info("T: %.2f [s]", round(self.T, 2))
-        hd_mean = self.df.hydro_depth.mean()
-        hd_sd = self.df.hydro_depth.std()
-        self.logger.info("Mean hydrostatic depth: %.2f [m]", hd_mean)
-        self.logger.info("SD hydrostatic depth: %.2f [m]", hd_sd)
-        # Starting from guess value (suits deep water waves better)
-        self.L = (G/(2 * PI)) * (self.T ** 2)
-        self.logger.info("Estimated L: %.2f" % round(self.L, 2))
-        # Iterative process
-        err_tol = 1
-        while err_tol > 1e-6:
-            lb = (G / (2 * PI)) * (self.T ** 2) * np.tanh(2 * PI *
-                                                          (hd_mean / self.L))
-            err_tol = np.abs(lb - self.L)
-            self.L = lb
+        self.logger.info("Mean hydrostatic depth: %.2f [m]", self.stats.mean)
+        self.logger.info("SD hydrostatic depth: %.2f [m]", self.stats.sd)
+        L, k, converged = dispersion.solve(self.T, self.stats.mean)
+        self.L = float(L)
+        if not converged:
+            self.logger.warning("L not converged for %s", str(self))
         self.logger.info("Converged L: %.2f" % round(self.L, 2))
 
     def _calc_K(self):
@@ -127,8 +183,8 @@ class Burst(object):
 
         Math: H = 4hSD * (cosh(k*h)/cosh[z* + h])
         """
-        hd_sd = self.df.hydro_depth.std()
-        hd_mean = self.df.hydro_depth.mean()
+        hd_sd = self.stats.sd
+        hd_mean = self.stats.mean
         self.H = 4 * hd_sd * ((np.cosh(self.K * hd_mean) /
                                np.cosh(self.K * (self.z + hd_mean))))
         self.logger.info("Sig. wave height: %f [m]", self.H)
@@ -137,8 +193,8 @@ class Burst(object):
         """
         Calculates significant orbital speed athe bed U
         """
-        hd_sd = self.df.hydro_depth.std()
-        hd_mean = self.df.hydro_depth.mean()
+        hd_sd = self.stats.sd
+        hd_mean = self.stats.mean
         n = (4 * PI * hd_sd * np.cosh(self.K * hd_mean))
         d = (self.T * np.cosh(self.K * (self.z + hd_mean)) *
              np.sinh(self.K * hd_mean))
@@ -173,6 +229,17 @@ class Burst(object):
     def get_UTH(self):
         return (self.U, self.T, self.H)
 
+    def get_result(self, start=None, end=None, source=None, spectrum=False):
+        """
+        Compact BurstResult of this burst, see BurstResult.
+        start/end default to the burst first and last sample times.
+        """
+        if start is None:
+            start = self.t[0]
+        if end is None:
+            end = self.t[-1] + pd.Timedelta(1, unit="ns")
+        return BurstResult(self, start, end, source=source, spectrum=spectrum)
+
     def plot_freqs(self):
         """ Plot frequencies method to be implemented in each subclass """
         raise NotImplementedError("Burst must define a plot freqs method")
@@ -183,7 +250,7 @@ class Burst(object):
 
         Note: only works if method is 'peaks' when defining Burst
         """
-        hd_mean = self.hydro_depth.mean()
+        hd_mean = self.stats.mean
         fig, ax = plt.subplots(1, 1, figsize=(12, 6))
         nrow_series = pd.Series(np.arange(1, self.sr + 1), name="nrow")
         ax.plot(nrow_series, self.df.hydro_depth, marker=".", color="blue")
@@ -193,23 +260,21 @@ class Burst(object):
 
 
 class BurstFourier(Burst):
+    METHOD = "fourier"
 
     def _calc_T(self):
         """
-        Apply scipy.fftpack.fft Fast Fourier Transform to signal
-        self.df.hydro_depth_dt
+        Apply real Fast Fourier Transform to signal
+        self.df.hydro_depth_dt (see fourier.Spectrum)
 
         Result stored in self.T [s]
         """
-        self.s_fft = fftpack.fft(self.df.hydro_depth_dt*signal.hann(self.sr))
-        self.pwr = np.abs(self.s_fft)
-        self.s_freq = fftpack.fftfreq(self.sr, d=self.rate)
-
-        # Find the peak frequency, focus on only the positive frequencies
-        self.freqs = self.s_freq[self.s_freq > 0]
-        idx = np.argmax(np.abs(self.s_fft))
-        self.pf = self.freqs[idx]  # peak freq
-        self.ppwr = self.pwr[idx]  # peak power
+        self.spectrum = fourier.Spectrum(self.df.hydro_depth_dt.values, self.f)
+        self.s_fft = self.spectrum.s_fft
+        self.pwr = self.spectrum.pwr
+        self.freqs = self.spectrum.freqs
+        self.pf = self.spectrum.pf  # peak freq
+        self.ppwr = self.spectrum.ppwr  # peak power
 
         # Find the period T [s]
         # self.pp = 2*PI/self.pf  # peak period is 2*PI/peakfreq
@@ -242,9 +307,7 @@ class BurstFourier(Burst):
 
         # inverse FFT
         # remove higher freqs than Peak Freq
-        fft_bis = self.s_fft.copy()
-        fft_bis[np.abs(self.s_freq) > self.pf] = 0
-        ifft = np.real(fftpack.ifft(fft_bis))
+        ifft = self.spectrum.filtered()
         ax1.plot(self.t, ifft, color="red", label="Inverse FFT")
         ax0.legend()
         ax1.legend()
@@ -252,6 +315,7 @@ class BurstFourier(Burst):
 
 
 class BurstWelch(Burst):
+    METHOD = "welch"
 
     def _calc_T(self):
         """
@@ -318,6 +382,7 @@ class BurstWelch(Burst):
 
 
 class BurstPeaks(Burst):
+    METHOD = "peaks"
 
     def _calc_T(self):
         """
@@ -329,12 +394,101 @@ class BurstPeaks(Burst):
         self.peaks = peakutils.indexes(
                         self.df.hydro_depth,
                         min_dist=10,
-                        thres=self.df.hydro_depth.mean(),
+                        thres=self.stats.mean,
                         thres_abs=True)
         periods = np.diff(self.peaks)  # difference between peaks
+        if not len(periods):  # less than two peaks
+            self.T = np.nan
+            self.pf = np.nan
+            return
         mean_period = round(sum(periods)/len(periods), 2)
         self.T = (mean_period / self.sr) * (self.t[-1] - self.t[0]).seconds
         self.pf = 1/self.T
 
     def plot_freqs(self):
         return None
+
+
+class BurstResult(object):
+    r"""
+    Compact result of a Burst: derived scalars and, optionally, its float32
+    spectrum. Burst dataframe and arrays are not kept, the Burst is rebuilt
+    from its source device when needed (see plot_freqs).
+
+    Parameters
+    ----------
+    burst : Burst
+        Calculated burst
+    start, end : pandas.Timestamp
+        Burst window, as given to Device.get_burst
+    source : Device
+        Device to rebuild the burst from
+    spectrum : bool
+        Keep burst frequencies and power as float32 arrays
+    """
+    __slots__ = ["device", "method", "start", "end", "n", "U", "T", "H",
+                 "K", "L", "pf", "hd_mean", "hd_sd", "freqs", "pwr",
+                 "source"]
+
+    def __init__(self, burst, start, end, source=None, spectrum=False):
+        self.device = burst.device
+        self.method = burst.METHOD
+        self.start = start
+        self.end = end
+        self.n = burst.sr
+        self.U = np.float64(burst.U)
+        self.T = np.float64(burst.T)
+        self.H = np.float64(burst.H)
+        self.K = np.float64(burst.K)
+        self.L = np.float64(burst.L)
+        self.pf = np.float64(burst.pf)
+        self.hd_mean = np.float64(burst.stats.mean)
+        self.hd_sd = np.float64(burst.stats.sd)
+        self.freqs = None
+        self.pwr = None
+        if spectrum and hasattr(burst, "freqs"):
+            self.freqs = np.asarray(burst.freqs, dtype=np.float32)
+            self.pwr = np.asarray(
+                burst.pwr[:len(burst.freqs)], dtype=np.float32)
+        self.source = source
+
+    def __str__(self):
+        return ("Burst %s to %s") % (self.start, self.end)
+
+    def unicode(self):
+        return self.__str__()
+
+    def get_K(self):
+        return self.K
+
+    def get_lambda(self):
+        return self.L
+
+    def get_U(self):
+        return self.U
+
+    def get_T(self):
+        return self.T
+
+    def get_H(self):
+        return self.H
+
+    def get_UTH(self):
+        return (self.U, self.T, self.H)
+
+    def get_burst(self, source=None):
+        """
+        Rebuild full Burst from source device (or the one given)
+        """
+        if source is None:
+            source = self.source
+        if source is None:
+            raise ValueError("No device to rebuild %s from" % str(self))
+        return source.get_burst(
+            start=self.start, end=self.end, method=self.method)
+
+    def plot_freqs(self, source=None):
+        """
+        Rebuild the Burst and plot its frequencies
+        """
+        return self.get_burst(source).plot_freqs()
@@ -9,6 +9,14 @@ PROCESSED_PATH = "./data/rsk/"
 H5_PATH = "./data/hd5/"
 AVG_FOLDER = "average"
 FLUXES_PATH = "./data/fluxes/"
+MEMMAP_FOLDER = "memmap"  # float32 memory-mapped sample stores
+PARQUET_FOLDER = "parquet"  # day partitioned datasets, optional (pyarrow)
+PYRAMID_FOLDER = "pyramid"  # multi-resolution rollups, see tools.pyramid
+PYRAMID_LEVELS = [600, 1800, 3600, 86400]  # rollup resolutions [s]
+CACHE_PATH = "./data/cache/bursts.sqlite"
+CACHE_MAX_ENTRIES = 500000  # bursts kept in cache, least recently used out
+OBS_CALIBRATION_PATH = "./ml/OBS_calibration/"
+DEVICE_MEMORY_BUDGET = 4 * 1024**3  # bytes of devices data kept in memory
 
 BATHYMETRY_PATH = "./data/transect_bathymetry.csv"
 KARIN_PATH = "./data/KarinProfile.csv"
@@ -66,6 +74,7 @@ SITES_DISTANCES = [
 MIN_DEPTH = 0.05  # in m, always >
 MIN_TURB = 0  # in NTU, always >
 Z_ELEVATION = 0.15  # 15cm - elevation above the seabed of pressure sensor
+FFT_WORKERS = -1  # threads for batches of FFTs, -1 all CPUs (scipy >= 1.4)
 
 # rsk variables
 TURBIDITY = {"name": "Turbidity", "units": "NTU"}
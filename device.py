@@ -2,13 +2,30 @@ import logging
 import numpy as np
 import os.path
 import pandas as pd
-import pyrsktools
 
-from burst import BurstFourier, BurstWelch, BurstPeaks
+from batch import calc_chunk, pack_bursts
+from concurrent.futures import ProcessPoolExecutor
+from burst import (BurstFourier, BurstWelch, BurstPeaks,
+                   calc_density, calc_hydrostatic_depth)
 from constants import (H5_PATH, OUTPUT_PATH, PROCESSED_PATH, VARIABLES,
-                       TIMEZONE, AVG_FOLDER, Z_ELEVATION, DEVICES)
-from intervals import DATA_INTERVALS, CALM_INTERVALS, STORM_INTERVALS
-from tools import plotter, station
+                       TIMEZONE, AVG_FOLDER, PARQUET_FOLDER,
+                       MEMMAP_FOLDER, PYRAMID_FOLDER, Z_ELEVATION, DEVICES)
+from intervals import STORM_INTERVALS
+from tools import (dtypes, masks, memstore, parquet, partitions, plotter,
+                   station, storage, tides)
+from tools.pyramid import Pyramid
+from tools.burstindex import BurstIndex
+from tools.calibration import Calibration, get_rising
+from tools.cache import burst_digests, params_hash
+
+
+BURST_VARS = [
+    "salinity_00",
+    "temperature_00",
+    "seapressure_00",
+    "depth_00"]
+
+CHUNKS_PER_WORKER = 4  # burst chunks submitted to each worker process
 
 
 class Device(object):
@@ -35,16 +52,33 @@ class Device(object):
         Suspended sediment concentration [mg/L]
         Same length as T
     dformat : string
-        Data format "h5" or "rsk"
+        Data format "h5", "rsk" or "parquet" (see save_parquet)
+    workers : int
+        Number of processes to calculate bursts with, serial if None
+    cache : tools.cache.BurstCache
+        Cache of bursts results, not used if None
+    calibration : tools.calibration.Calibration
+        Turbidity to SSC curve, linear interpolation of T with SSC (rising
+        branch, see tools.calibration.get_rising) if None
+    start, end : str
+        Only data from start to end dates loaded, "parquet" format only
+    columns : list
+        Only these raw data columns loaded (see _read_df)
+    compact : bool
+        Float columns as float32 and labels (e.g. Tide) as categoricals,
+        kept through cleaning and averaging, saved as float64 and object
+        columns (see tools.dtypes)
     """
 
-    def __init__(self, site, dtype, file, f, sr, i, T, SSC, dformat):
+    def __init__(self, site, dtype, file, f, sr, i, T, SSC, dformat,
+                 workers=None, cache=None, calibration=None, start=None,
+                 end=None, columns=None, compact=False):
         self.site = site
         self.dtype = dtype
         self._init_logger()
         if dtype not in ["floater", "bedframe"]:
             raise ValueError("Unknown device type")
-        if dformat not in ["rsk", "h5"]:
+        if dformat not in ["rsk", "h5", "parquet"]:
             raise ValueError("Unknown data format type")
         self.file = file
         self.f = f
@@ -56,9 +90,25 @@ class Device(object):
             raise ValueError("T and SSC must have the same length")
         self.T = T
         self.SSC = SSC
+        if calibration is None:
+            calibration = Calibration(*get_rising(T, SSC))
+        self.calibration = calibration
         self.format = dformat
+        self.workers = workers
+        self.cache = cache
+        self.start = start
+        self.end = end
+        self.columns = columns
+        self.compact = compact
         self.vars = []
-        self._load_data()
+        self.store = None  # see get_store
+        self._store_checked = False
+        self.burst_index = None
+        # data is loaded on first access, see df and df_avg
+        self._df = None
+        self._df_avg = None
+        self._pyramids = {}  # raw (False) and averaged (True), see get_pyramid
+        self.registry = None  # tools.registry.DeviceRegistry if shared
 
     def _init_logger(self):
         self.logger = logging.getLogger(str(self))
@@ -81,120 +131,507 @@ class Device(object):
                 if v in VARIABLES.keys():
                     self.vars.append(VARIABLES[v])
 
-    def _load_data(self):
+    @property
+    def df(self):
+        """
+        Raw data pandas.DataFrame, read from the device file on first
+        access (see _load_df)
+        """
+        if self._df is None:
+            self._load_df()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self._pyramids.pop(False, None)
+
+    @property
+    def df_avg(self):
+        """
+        Burst-averaged data pandas.DataFrame, read on first access
+        (see _load_df_avg). Raw data is only read if there is no averaged
+        file yet.
         """
-        Loads data from device file into self.df as a pandas.DataFrame.
-        Loads burst-averaged data into self.df_avg as a pandas.DataFrame.
+        if self._df_avg is None:
+            self._load_df_avg()
+        return self._df_avg
+
+    @df_avg.setter
+    def df_avg(self, df_avg):
+        self._df_avg = df_avg
+        self._pyramids.pop(True, None)
+
+    def _read_df(self, columns=None):
+        """
+        Raw data of the device file, only given columns (all if None).
+        Columns are selected on disk from parquet datasets and table h5
+        files (see is_table), fixed h5 files are read whole.
         """
-        self.df = None
-        self.df_avg = None
         if self.format == "h5":
-            data_path = self.get_H5_path()
-            self.df = pd.read_hdf(data_path, "df")
-            try:
-                self.df_avg = pd.read_hdf(self.get_H5_avg_path(), "df")
-            except FileNotFoundError:
-                self.set_df_avg(save=True)
-            self.set_tide()
-            self.logger.info(
-                "Using %s as a dataframe source for averaged %s",
-                self.get_H5_avg_path(),
-                str(self))
-            self.logger.info(self.df_avg.shape)
-            self.logger.info(
-                "NAN values: %s",
-                str(self.df_avg.isnull().T.any().T.sum()))
-        else:  # rsk
-            data_path = self.get_RSK_path()
-            rsk = pyrsktools.open(data_path)
-            # Pandas dataframe for the win
-            self.df = pd.DataFrame(rsk.npsamples())
-            # timestamp as index, localize it as NZST
-            self.df = self.df.set_index("timestamp")
-            self.df.index = self.df.index.tz_convert(None)
-            self.df.index = self.df.index.tz_localize(TIMEZONE)
+            return storage.read_hdf(self.get_H5_path(), columns)
+        elif self.format == "parquet":
+            # only the days (and columns) needed, see save_parquet
+            return parquet.read_dataset(
+                self.get_parquet_path(), self.start, self.end, columns)
+        # rsk, read in chunks, timestamp as index localized as NZST
+        df = pd.concat(storage.iter_rsk(self.get_RSK_path(), tz=TIMEZONE))
+        if columns is not None:
+            df = df[columns]
+        return df
+
+    def _load_df(self):
+        """
+        Loads data from device file into self.df as a pandas.DataFrame,
+        only self.columns if given
+        """
+        self.df = self._read_df(self.columns)
+        if self.format == "rsk":
             self.set_ssc()
+        if self.compact:
+            self.df = dtypes.compact(self.df)
         self.logger.info(
             "Using %s as a dataframe source for %s",
-            data_path,
+            self.get_data_path(),
             str(self))
         self.logger.info(self.df.shape)
         self.logger.info(
             "NAN values: %s",
             str(self.df.isnull().T.any().T.sum()))
         self._set_vars()
+        self._set_burst_index()
+        if self.registry is not None:
+            self.registry.loaded(self)
 
-    def _calc_bursts(self):
+    def release_df(self):
+        """
+        Free raw data (and its burst index), read again on next access.
+        Changes to self.df not saved are lost.
+        """
+        self._df = None
+        self.burst_index = None
+        self.vars = []
+        self.logger.info("Raw data of %s released", str(self))
+
+    def _load_df_avg(self):
+        """
+        Loads burst-averaged data into self.df_avg as a pandas.DataFrame,
+        calculated (and saved) from raw data if there is no h5 file.
+        None for rsk files (see set_df_avg).
+        """
+        if self.format == "h5":
+            avg_path = self.get_H5_avg_path()
+            try:
+                self.df_avg = pd.read_hdf(avg_path, "df")
+            except FileNotFoundError:
+                self.set_df_avg(save=True)
+        elif self.format == "parquet":
+            avg_path = self.get_parquet_path(avg=True)
+            self.df_avg = parquet.read_dataset(
+                avg_path, self.start, self.end)
+        else:  # rsk
+            return
+        self.set_tide()
+        if self.compact:
+            self.df_avg = dtypes.compact(self.df_avg)
+        self.logger.info(
+            "Using %s as a dataframe source for averaged %s",
+            avg_path,
+            str(self))
+        self.logger.info(self.df_avg.shape)
+        self.logger.info(
+            "NAN values: %s",
+            str(self.df_avg.isnull().T.any().T.sum()))
+
+    def get_columns(self, columns, avg=False):
+        """
+        pandas.DataFrame of some columns of raw (or averaged) data.
+        Raw data not loaded yet is not loaded, only those columns are read
+        from parquet datasets or table h5 files (see _read_df).
+        """
+        if avg:
+            return self.df_avg[columns]
+        if self._df is not None:
+            return self._df[columns]
+        if self.columns is not None:  # can't read outside the projection
+            missing = [c for c in columns if c not in self.columns]
+            if missing:
+                raise KeyError("Columns %s not loaded" % missing)
+        if self.format == "parquet" or self.is_table():
+            return self._read_df(columns)
+        return self.df[columns]
+
+    def _set_burst_index(self):
+        """
+        Load the burst index of self.df saved next to its h5 file, or
+        build it (and save it for h5 files)
+        """
+        path = self.get_burst_index_path()
+        self.burst_index = BurstIndex.load(path, self.df, self.i, self.sr)
+        if self.burst_index is None:
+            self.burst_index = BurstIndex.build(
+                self.df, self.i, self.sr, BURST_VARS)
+            if self.format == "h5" and self.columns is None:
+                self.burst_index.save(path)
+        self.logger.info("%s for %s", str(self.burst_index), str(self))
+
+    def _calc_bursts(self, method="welch", batch=False, nperseg=None,
+                     workers=None, cache=None, df_avg=None, df=None):
         """
         Calculates U, T and H for each valid burst.
         Note: only available for bedframe devices.
+
+        If batch, bursts are analysed at once by batch.BurstBatch.
+        If workers > 1, bursts are split in chunks and analysed by a pool
+        of workers processes, results are the same as the serial ones.
+        If cache (tools.cache.BurstCache) is given, only bursts not found
+        there are calculated.
+        Bursts of the rows of df_avg (self.df_avg if None, changed in
+        place) are calculated from raw data df (self.df if None).
         """
         # Orbital speed, sig wave height and period
         if self.dtype != "bedframe":
             raise NotImplementedError("Not available in current class")
-        self.df_avg["u"] = np.NaN
-        self.df_avg["T"] = np.NaN
-        self.df_avg["H"] = np.NaN
-        df = self.clean_df(self.df, average=False)
-        # Calculate U for each available burst
-        start_date = self.df_avg.index[0]
-        while start_date <= self.df_avg.index[-1]:
-            end_date = start_date + pd.Timedelta("%ss" % self.i)
-            burst = self.get_burst(
-                        start=start_date,
-                        end=end_date,
-                        method="welch",
-                        df=df)
-            if burst:
-                self.df_avg.loc[start_date, ["u", "T", "H"]] = burst.get_UTH()
+        if df_avg is None:
+            df_avg = self.df_avg
+        if df is None:
+            df = self.df
+        df_avg["u"] = np.NaN
+        df_avg["T"] = np.NaN
+        df_avg["H"] = np.NaN
+        start = df_avg.index[0]
+        df = self.clean_df(df, average=False)
+        df = self.get_hydrostatic_df(df, start=start)
+        ids = self.get_burst_ids(df.index, start)
+        bids, offsets, lengths = pack_bursts(ids, df.values, self.sr)
+        starts = start + pd.to_timedelta(bids * self.i, unit="s")
+        todo = np.ones(len(bids), dtype=bool)
+        uth = np.full((len(bids), 3), np.nan)
+        if cache is not None:
+            params = params_hash(f=self.f, sr=self.sr, i=self.i, z=self.z,
+                                 batch=batch, nperseg=nperseg)
+            digests = burst_digests(df.values, offsets, lengths)
+            uth, found = cache.get(
+                self.file, method, params, starts.asi8, digests)
+            todo = ~found
+            self.logger.info("%d of %d bursts found in %s",
+                             found.sum(), len(bids), str(cache))
+        if todo.any():
+            uth[todo], ok = self._calc_burst_chunks(
+                df, offsets[todo], lengths[todo], starts[todo],
+                method, batch, nperseg, workers)
+            if cache is not None:
+                stored = np.flatnonzero(todo)[ok]
+                cache.put(self.file, method, params, starts.asi8[stored],
+                          [digests[i] for i in stored], uth[stored])
+        df_avg.loc[starts, ["u", "T", "H"]] = uth
+        for start_date in df_avg.index.difference(starts):
+            self.logger.warning("Invalid burst start date %s end date %s",
+                                str(start_date),
+                                str(start_date + pd.Timedelta("%ss" % self.i)))
+
+    def _calc_burst_chunks(self, df, offsets, lengths, starts,
+                           method="welch", batch=False, nperseg=None,
+                           workers=None):
+        """
+        Calculate U, T and H of the bursts at offsets/lengths of df
+        (see batch.calc_chunk), in a pool of workers processes if
+        workers > 1. Bursts are split in chunks, failed chunks are logged
+        and their bursts left as NaN.
+
+        Returns (uth, ok): 2-D array (n_bursts x 3) and boolean mask of
+        bursts calculated.
+        """
+        columns = list(df.columns)
+        values = df.values
+        t = df.index.asi8
+        uth = np.full((len(offsets), 3), np.nan)
+        ok = np.ones(len(offsets), dtype=bool)
+        if workers is None or workers < 2:
+            uth[:] = calc_chunk(values, t, df.index.tz, columns, offsets,
+                                lengths, self.f, self.z, str(self),
+                                method=method, batch=batch, nperseg=nperseg)
+            return uth, ok
+        chunks = [c for c in np.array_split(np.arange(len(offsets)),
+                                            workers * CHUNKS_PER_WORKER)
+                  if len(c)]
+        self.logger.info("Calculating %d bursts in %d chunks, %d workers",
+                         len(offsets), len(chunks), workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for c in chunks:
+                first = offsets[c[0]]
+                last = offsets[c[-1]] + lengths[c[-1]]
+                futures.append(executor.submit(
+                    calc_chunk,
+                    values[first:last],
+                    t[first:last],
+                    df.index.tz,
+                    columns,
+                    offsets[c] - first,
+                    lengths[c],
+                    self.f,
+                    self.z,
+                    str(self),
+                    method=method,
+                    batch=batch,
+                    nperseg=nperseg))
+            for c, future in zip(chunks, futures):
+                try:
+                    uth[c] = future.result()
+                except Exception as e:
+                    ok[c] = False
+                    self.logger.error(
+                        "Bursts chunk %s to %s failed: %s",
+                        str(starts[c[0]]),
+                        str(starts[c[-1]]),
+                        repr(e))
+        return uth, ok
+
+    def get_burst_ids(self, index, start):
+        """
+        Number of the burst (interval of self.i seconds counted from start)
+        each timestamp of index belongs to.
+        """
+        start = pd.Timestamp(start)
+        return (index.asi8 - start.value) // (self.i * 10**9)
+
+    def get_hydrostatic_df(self, df, start=None):
+        """
+        Burst variables of df along with density and hydrostatic depth,
+        calculated for every sample in a single vectorized pass
+        (see burst.Burst).
+        Density is averaged over the first self.sr samples of each burst,
+        same as Burst does on its own slice, so bursts can take these
+        columns as they are.
+        """
+        if start is None:
+            start = df.index[0]
+        dfh = pd.DataFrame(
+            {v: df[v].values.astype(float) for v in BURST_VARS},
+            index=df.index,
+            columns=BURST_VARS)
+        dfh["density"] = calc_density(
+            dfh.salinity_00.values,
+            dfh.temperature_00.values,
+            dfh.seapressure_00.values)
+        ids = self.get_burst_ids(dfh.index, start)
+        density = pd.Series(dfh["density"].values)
+        nrow = density.groupby(ids).cumcount().values
+        density_mean = density.where(nrow < self.sr).groupby(ids).transform(
+            "mean")
+        dfh["hydro_depth"] = calc_hydrostatic_depth(
+            dfh.seapressure_00.values,
+            density_mean.values,
+            self.z)
+        return dfh
+
+    def set_tide(self, force=False):
+        """
+        Tidal phase of the averaged depth: trend of tide Ebb/Flood, tidal
+        cycle and hours from high water (see tools.tides), calculated once
+        """
+        tides.set_tidal_columns(self.df_avg, "depth_00", force=force)
+
+    def set_ssc(self, force=False):
+        """
+        Calculate SSC from turbidity with self.calibration, whole column
+        at once. Saturated values are NaN (see tools.calibration).
+        """
+        if force or "ssc" not in self.df.columns:
+            ssc = self.calibration.convert(self.df.turbidity_00.values)
+            if self.compact:
+                ssc = ssc.astype(dtypes.FLOAT_DTYPE)
+            self.df["ssc"] = ssc
+
+    def set_calibration(self, calibration, save=False):
+        """
+        Change the OBS calibration: SSC is calculated again for the raw
+        data and re-averaged into self.df_avg, other averaged variables
+        (and bursts) are kept as they are.
+        If save, raw and averaged h5 files are written again: only for
+        h5 devices with all columns loaded and not compact (the raw file
+        would lose columns or precision otherwise).
+        """
+        if save and (self.format != "h5" or self.columns is not None or
+                     self.compact):
+            raise ValueError("Calibration saved only for h5 devices with "
+                             "all columns, not compact.")
+        self.calibration = calibration
+        self.T = calibration.T
+        self.SSC = calibration.SSC
+        self.set_ssc(force=True)
+        if self.df_avg is not None:
+            df_avg = self.clean_df(self.df[["turbidity_00", "ssc"]])
+            self.df_avg["ssc"] = df_avg.ssc.reindex(self.df_avg.index)
+            self.df_avg["ssc_sd"] = self.df.ssc.resample(
+                "%ss" % self.i).std()
+            if self.compact:
+                self.df_avg = dtypes.compact(self.df_avg)
+        self.logger.info("%s set for %s", str(calibration), str(self))
+        if save:
+            if storage.is_table(self.get_H5_path()):
+                storage.write_table(self.get_H5_path(), self.df)
             else:
-                self.logger.warning("Invalid burst start date %s end date %s",
-                                    str(start_date),
-                                    str(end_date))
-            start_date = end_date
-
-    def set_tide(self):
-        """
-        Calculate trend of tide Ebb/Flood depending on next row's depth
-        """
-        if "Tide" not in self.df_avg.columns:
-            self.df_avg["Tide"] = np.where(
-                self.df_avg["depth_00"] > self.df_avg["depth_00"].shift(-1),
-                "Ebb",
-                "Flood")
-        # last row doesn't have a next, compare with previous row
-        last_rows = self.df_avg.tail(2)
-        if last_rows.iloc[0].depth_00 > last_rows.iloc[1].depth_00:
-            self.df_avg.at[self.df_avg.index[-1], "Tide"] = "Ebb"
-        else:
-            self.df_avg.at[self.df_avg.index[-1], "Tide"] = "Flood"
-
-    def set_ssc(self):
-        """
-        Calculate SSC from linear interpolation of self.T with self.SSC
-        """
-        if "ssc" not in self.df.columns:
-            self.df["ssc"] = self.df.apply(
-                lambda r: np.interp(
-                    r.turbidity_00,
-                    self.T,
-                    self.SSC),
-                axis=1)
-            # S1 floater saturated, remove max values
-            if self.site == "S1" and self.dtype == "floater":
-                d = self.get_dict_device()
-                self.df.loc[
-                    self.df["ssc"] == d["ssc_saturated_value"], ["ssc"]
-                    ] = np.NaN
+                dtypes.to_hdf(self.df, self.get_H5_path())
+            self.save_H5(avg=True)
+            if os.path.isfile(self.get_pyramid_path()):
+                self.save_pyramid()
 
     def save_H5(self, avg=False):
         """
         Saves device data to h5 file
         """
         if not os.path.isfile(self.get_H5_path()):
-            self.df.to_hdf(self.get_H5_path(), key="df", mode="w")
+            dtypes.to_hdf(self.df, self.get_H5_path())
+        if avg:
+            dtypes.to_hdf(self.df_avg, self.get_H5_avg_path())
+
+    def save_H5_table(self):
+        """
+        Saves device raw data to its h5 file in table format (chunked,
+        queryable, see is_table). Only with all columns loaded and not
+        compact, the h5 file would lose columns or precision otherwise.
+        """
+        if self.columns is not None or self.compact:
+            raise ValueError("Table saved only with all columns, "
+                             "not compact.")
+        storage.write_table(self.get_H5_path(), self.df)
+
+    def is_table(self):
+        """
+        The h5 file is in table format (see save_H5_table and
+        encoder.rsk_to_H5): columns, bursts and appended rows are read
+        from it without reading it whole
+        """
+        return (self.format == "h5" and os.path.isfile(self.get_H5_path())
+                and storage.is_table(self.get_H5_path()))
+
+    def save_parquet(self):
+        """
+        Saves device raw and averaged data to parquet datasets partitioned
+        by day, to load only some days and columns (dformat "parquet")
+        """
+        parquet.write_dataset(self.get_parquet_path(),
+                              dtypes.expand(self.df))
+        if self.df_avg is not None:
+            parquet.write_dataset(self.get_parquet_path(avg=True),
+                                  dtypes.expand(self.df_avg))
+
+    def save_pyramid(self):
+        """
+        Saves rollups of raw and averaged data at PYRAMID_LEVELS
+        resolutions (see get_rollup)
+        """
+        for avg, df in [(False, self.df), (True, self.df_avg)]:
+            if df is None:
+                continue
+            pyramid = Pyramid.build(df)
+            pyramid.save(self.get_pyramid_path(avg))
+            self._pyramids[avg] = pyramid
+            self.logger.info("%s saved for %s", str(pyramid), str(self))
+
+    def get_pyramid(self, avg=False):
+        """
+        Rollups of raw (averaged if avg) data saved by save_pyramid, None
+        if there are none or they are not of the data loaded (rows
+        changed since)
+        """
+        if avg not in self._pyramids:
+            self._pyramids[avg] = Pyramid.load(self.get_pyramid_path(avg))
+        pyramid = self._pyramids[avg]
+        df = self._df_avg if avg else self._df
+        if pyramid is not None and df is not None and not pyramid.matches(
+                df.index):
+            self.logger.info("Pyramid of %s out of date", str(self))
+            pyramid = self._pyramids[avg] = None
+        return pyramid
+
+    def get_rollup(self, resolution, start=None, end=None, stat="mean",
+                   columns=None, avg=False):
+        """
+        stat (e.g. "mean", "std", "max" or a list of them) of raw
+        (averaged if avg) data per bin of resolution [s] from start to end
+        (excluded), as a resample of the data would give. Taken from the
+        pyramid (see save_pyramid) without reading the data when it has a
+        fitting level, resampled from the data otherwise.
+        """
+        pyramid = self.get_pyramid(avg)
+        if pyramid is not None:
+            df = pyramid.query(resolution, start, end, stat, columns)
+            if df is not None:
+                return df
+        df = self.df_avg if avg else self.df
+        first, last = 0, len(df)
+        for j, date in [(0, start), (1, end)]:
+            if date is None:
+                continue
+            date = pd.Timestamp(date)
+            if date.tz is None and df.index.tz is not None:
+                date = date.tz_localize(df.index.tz, ambiguous=False,
+                                        nonexistent="shift_forward")
+            if j:
+                last = df.index.searchsorted(date)
+            else:
+                first = df.index.searchsorted(date)
+        df = df.iloc[first:last]
+        if columns is not None:
+            df = df[columns]
+        return df.resample("%ss" % resolution).agg(stat)
+
+    def save_memmap(self):
+        """
+        Saves device raw data to a float32 memory-mapped sample store,
+        bursts are then sliced from it (see get_burst)
+        """
+        memstore.write(self.get_memmap_path(), self.df, self.i)
+        self.store = memstore.SampleStore(self.get_memmap_path())
+        self._store_checked = True
+
+    def get_store(self):
+        """
+        Sample store of raw data (see save_memmap), None if there is none
+        or it is not of the data file (rows changed since, e.g. appended).
+        Checked once, against the h5 file index (or raw data if loaded).
+        """
+        if self._store_checked:
+            return self.store
+        self._store_checked = True
+        if not os.path.isdir(self.get_memmap_path()):
+            return None
+        store = memstore.SampleStore(self.get_memmap_path())
+        if self._df is not None:
+            t = self._df.index.asi8
+            bounds = (len(t), t[0] if len(t) else 0, t[-1] if len(t) else 0)
+        elif self.format == "h5":
+            bounds = storage.get_bounds(self.get_H5_path())
+        else:  # can't be checked without reading the data
+            bounds = None
+        if bounds is not None and store.matches(*bounds):
+            self.store = store
+        else:
+            self.logger.info("%s out of date, not used", str(store))
+        return self.store
+
+    def get_memmap_path(self):
+        return "%s%s/%s" % (H5_PATH, MEMMAP_FOLDER, self.file)
+
+    def get_parquet_path(self, avg=False):
         if avg:
-            self.df_avg.to_hdf(self.get_H5_avg_path(), key="df", mode="w")
+            return "%s%s/%s/%s" % (H5_PATH, PARQUET_FOLDER, AVG_FOLDER,
+                                   self.file)
+        return "%s%s/%s" % (H5_PATH, PARQUET_FOLDER, self.file)
+
+    def get_data_path(self):
+        """ Raw data file (dataset folder for parquet) of self.format """
+        if self.format == "h5":
+            return self.get_H5_path()
+        elif self.format == "parquet":
+            return self.get_parquet_path()
+        return self.get_RSK_path()
+
+    def get_burst_index_path(self):
+        return "%s%s.bursts.npz" % (H5_PATH, self.file)
 
     def get_H5_path(self):
         return "%s%s.h5" % (H5_PATH, self.file)
@@ -202,6 +639,12 @@ class Device(object):
     def get_H5_avg_path(self):
         return "%s%s/%s.h5" % (H5_PATH, AVG_FOLDER, self.file)
 
+    def get_pyramid_path(self, avg=False):
+        if avg:
+            return "%s%s/%s/%s.h5" % (H5_PATH, PYRAMID_FOLDER, AVG_FOLDER,
+                                      self.file)
+        return "%s%s/%s.h5" % (H5_PATH, PYRAMID_FOLDER, self.file)
+
     def get_RSK_path(self):
         return "%s%s_processed.rsk" % (PROCESSED_PATH, self.file)
 
@@ -210,14 +653,21 @@ class Device(object):
         Get Burst from start to end dates
 
         """
-        if df is None:
-            df = self.df
-        bvars = [
-            "salinity_00",
-            "temperature_00",
-            "seapressure_00",
-            "depth_00"]
-        dfburst = df[(df.index >= start) & (df.index < end)][:self.sr][bvars]
+        if df is None and self.get_store() is not None:
+            # only the burst read from the sample store, see save_memmap
+            dfburst = self.store.get_df(start, end, BURST_VARS, self.sr)
+        else:
+            if df is None:
+                df = self.df
+            # precomputed columns, see get_hydrostatic_df
+            bvars = BURST_VARS + [v for v in ["density", "hydro_depth"]
+                                  if v in df.columns]
+            if df is self.df and self.burst_index is not None:
+                first, last = self.burst_index.locate(start, end)
+                dfburst = df.iloc[first:min(last, first + self.sr)][bvars]
+            else:
+                dfburst = df[(df.index >= start) &
+                             (df.index < end)][:self.sr][bvars]
         # discard burst with missing values or NaN
         if ((len(dfburst) < (self.sr/2)) or
             (dfburst.isnull().values.sum() != 0) or
@@ -233,38 +683,185 @@ class Device(object):
             return BurstPeaks(
                 dfburst, dfburst.index, self.f, self.z, str(self))
 
-    def set_df_avg(self, save=False):
+    def iter_bursts(self, start=None, end=None, columns=None):
+        """
+        Generator of (burst start date, pandas.DataFrame) for each burst
+        from start to end dates, bursts truncated to self.sr samples.
+
+        Bursts are read one at a time from the h5 file if it is a table
+        (see is_table), so only one burst is in memory at once.
+        Otherwise they are sliced from self.df.
+        """
+        table = self.is_table()
+        if start is None or end is None:
+            if table:
+                first, last = storage.get_table_range(self.get_H5_path())
+            else:
+                first, last = self.df.index[0], self.df.index[-1]
+            if first is None:
+                return
+            start = first if start is None else start
+            end = last + pd.Timedelta("1ns") if end is None else end
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        if start.tz is None:
+            start = start.tz_localize(TIMEZONE)
+        if end.tz is None:
+            end = end.tz_localize(TIMEZONE)
+        start = start.floor("%ss" % self.i)
+        if table:
+            windows = storage.iter_windows(
+                self.get_H5_path(), start, end, self.i, columns)
+        else:
+            windows = self._iter_df_windows(start, end, columns)
+        for start_date, dfburst in windows:
+            yield start_date, dfburst[:self.sr]
+
+    def _iter_df_windows(self, start, end, columns=None):
+        """
+        Same windows as storage.iter_windows, sliced from self.df
+        """
+        df = self.df[(self.df.index >= start) & (self.df.index < end)]
+        if columns is not None:
+            df = df[columns]
+        ids = self.get_burst_ids(df.index, start)
+        bids, offsets = np.unique(ids, return_index=True)
+        bounds = np.append(offsets, len(df))
+        for j, bid in enumerate(bids):
+            dfburst = df.iloc[bounds[j]:bounds[j + 1]]
+            yield start + pd.Timedelta("%ss" % (bid * self.i)), dfburst
+
+    def get_burst_result(self, start=None, end=None, method="fourier",
+                         spectrum=False, df=None):
+        """
+        Compact burst.BurstResult of the Burst from start to end dates
+        """
+        burst = self.get_burst(start=start, end=end, method=method, df=df)
+        if burst is None:
+            return None
+        return burst.get_result(start=start,
+                                end=end,
+                                source=self,
+                                spectrum=spectrum)
+
+    def set_df_avg(self, save=False, method="welch", batch=False,
+                   workers=None):
         """
         Calculates SSC, clean data, average and save pandas.DataFrame
         in self.data_path_avg file
         """
+        if workers is None:
+            workers = self.workers
         self.set_ssc()
         self.df_avg = self.clean_df(self.df)
         self.df_avg["ssc_sd"] = self.df.ssc.resample("%ss" % self.i).std()
         if self.dtype == "bedframe":
-            self._calc_bursts()
+            self._calc_bursts(method=method, batch=batch, workers=workers,
+                              cache=self.cache)
+        if self.compact:
+            self.df_avg = dtypes.compact(self.df_avg)
         self.save_H5(avg=save)
 
+    def update_df_avg(self, save=False, method="welch", batch=False,
+                      workers=None):
+        """
+        Average raw data appended since self.df_avg was calculated: only
+        raw samples from the last averaged burst on (it may have been
+        incomplete) are read, averaged and their bursts calculated. New
+        rows replace the last one, tide is calculated again from the
+        tidal cycle before and only the rows changed are written to the
+        h5 file if save.
+        Everything is calculated if there is no averaged data yet.
+        Returns the number of new rows.
+        """
+        if workers is None:
+            workers = self.workers
+        if self.df_avg is None or not len(self.df_avg):
+            self.set_df_avg(save=save, method=method, batch=batch,
+                            workers=workers)
+            return len(self.df_avg)
+        last = self.df_avg.index[-1]
+        df = self._read_df_since(last)
+        if "ssc" not in df.columns:
+            df = df.assign(ssc=self.calibration.convert(
+                df.turbidity_00.values))
+        df_new = self.clean_df(df)
+        df_new["ssc_sd"] = df.ssc.resample("%ss" % self.i).std()
+        if self.dtype == "bedframe":
+            self._calc_bursts(method=method, batch=batch, workers=workers,
+                              cache=self.cache, df_avg=df_new, df=df)
+        seam = len(self.df_avg) - 1
+        df_avg = pd.concat([self.df_avg.iloc[:seam], df_new], sort=False)
+        changed = tides.update_tidal_columns(df_avg, seam)
+        if self.compact:
+            df_avg = dtypes.compact(df_avg)
+        self.df_avg = df_avg
+        self.logger.info("%d averaged rows from %s added to %s",
+                         len(df_new) - 1, str(last), str(self))
+        if save:
+            storage.replace_tail(self.get_H5_avg_path(),
+                                 dtypes.expand(df_avg),
+                                 df_avg.index[changed])
+        return len(df_new) - 1
+
+    def _read_df_since(self, start):
+        """
+        Raw data from start on: sliced from self.df if loaded, otherwise
+        only those rows are read if the h5 file is a table
+        (see is_table) or from the parquet dataset
+        """
+        if self._df is None:
+            df = None
+            if self.is_table():
+                df = storage.select_table(self.get_H5_path(), start=start,
+                                          columns=self.columns)
+            elif self.format == "parquet":
+                df = parquet.read_dataset(self.get_parquet_path(), start,
+                                          self.end, self.columns)
+            if df is not None:
+                return dtypes.compact(df) if self.compact else df
+        return self.df.iloc[self.df.index.searchsorted(start):]
+
+    def get_data_mask(self, index):
+        """
+        Boolean mask of the timestamps of index within the device's
+        DATA_INTERVALS (see tools.masks)
+        """
+        return masks.get_mask(index, "data", self.__str__())
+
     def clean_df(self, df, average=True):
-        """ Clean and average given dataframe df """
-        intervals = DATA_INTERVALS[self.__str__()]
+        """
+        Clean and average given dataframe df, only data within the
+        device's DATA_INTERVALS kept (see tools.masks)
+        """
         if average:
             df = df.resample("%ss" % self.i, label="left").mean()
-            dfr = pd.DataFrame(
-                    index=df.index,
-                    columns=df.columns) if intervals else df
+        mask = self.get_data_mask(df.index)
+        if mask.all():
+            dfr = df
+        elif average:
+            dfr = df.where(pd.Series(mask, index=df.index), axis=0)
         else:
-            dfr = pd.DataFrame(columns=df.columns) if intervals else df
-        if intervals:
-            for interval in intervals:
-                if average:
-                    dfr.update(df[interval[0]:interval[1]])
-                else:
-                    dfr = dfr.append(df[interval[0]:interval[1]])
+            dfr = df.take(np.flatnonzero(mask))
         # just in case some dodgy data sneaked into the intervals
         dfr.loc[dfr.turbidity_00 < 0, "turbidity_00"] = np.nan
+        if self.compact:
+            dfr = dtypes.compact(dfr)
         return dfr
 
+    def get_memory_report(self):
+        """
+        Memory used by raw and averaged data as they are and as float64
+        and object columns would [bytes] (see tools.dtypes)
+        """
+        report = {}
+        for name, df in [("raw", self.df), ("avg", self.df_avg)]:
+            if df is None:
+                continue
+            report[name] = dtypes.get_memory(df)
+            report["%s_full" % name] = dtypes.get_full_memory(df)
+        return report
+
     def get_depth_stats(self):
         """
         Burst-averaged mean, max, min values of Depth [m]
@@ -326,8 +923,10 @@ class Device(object):
         return self.__str__()
 
     def plot_days(self):
-        dflist = [group for group in self.df.groupby(self.df.index.date)]
-        for date, dfday in dflist:
+        # day slices of raw and averaged data, see tools.partitions
+        for day, rows in partitions.get_calendar(self.df.index).iter_days():
+            date = day.date()
+            dfday = self.df.iloc[rows]
             # all variables in the same plot
             dest_file = "%s%s/%s/%s.png" % (
                 OUTPUT_PATH,
@@ -343,7 +942,8 @@ class Device(object):
                 self.dtype,
                 AVG_FOLDER,
                 str(date))
-            dfr = dfday.resample("%ss" % self.i).mean()
+            dfr = self.get_rollup(self.i, day, day + pd.DateOffset(days=1),
+                                  columns=["ssc", "depth_00"])
             plotter.plot_hourly_ssc_depth_avg(
                 dfr[["ssc", "depth_00"]],
                 date,
@@ -351,7 +951,8 @@ class Device(object):
                 title)
             if self.df_avg is not None:
                 # averaged CLEAN turb and depth
-                dfr = self.df_avg[self.df_avg.index.date == date]
+                dfr = self.df_avg.iloc[
+                    partitions.get_calendar(self.df_avg.index).get_day(day)]
                 parts = dest_file.split(".")
                 dest_file = ".".join(parts[:-1]) + "_clean" + "." + parts[-1]
                 plotter.plot_hourly_ssc_depth_avg(
@@ -406,9 +1007,9 @@ class Device(object):
         dfrainlist = station.get_weekly_rainfall()
         dfpressurelist = station.get_weekly_pressure()
         dfrivers = station.get_weekly_rivers()
-        dflist = [g for g in self.df_avg.groupby(self.df_avg.index.week)]
+        dflist = partitions.split(self.df_avg, "week")
         if dffl is not None:
-            dffllist = [g for g in dffl.groupby(dffl.index.week)]
+            dffllist = partitions.split(dffl, "week")
         else:
             dffllist = [[None, None] for i in dflist]
         depthlist = self.get_weekly_corrected_depth()
@@ -421,7 +1022,7 @@ class Device(object):
                 self.dtype,
                 AVG_FOLDER,
                 i)
-            dfweek["u"] = dfweek["u"].fillna(-1)
+            dfweek = dfweek.assign(u=dfweek["u"].fillna(-1))
             plotter.plot_ssc_u_h_weekly_series(
                 dfweek,
                 dffllist[i][1],
@@ -440,10 +1041,13 @@ class Device(object):
         return plotter.plot_depth(self.df_avg)
 
     def get_weekly_corrected_depth(self):
-        self.df["depth_corrected"] = self.df["depth_00"] - 0.15
-        self.df.loc[self.df["depth_corrected"] < 0, ["depth_corrected"]] = 0
-        return [g[1]["depth_corrected"].resample("%ss" % self.i).mean()
-                for g in self.df.groupby(self.df.index.week)]
+        """
+        Weekly burst-averaged depth [m] 0.15 m down (not below 0)
+        """
+        depth = (self.df["depth_00"] - 0.15).clip(lower=0)
+        depth.name = "depth_corrected"
+        return [dfweek.resample("%ss" % self.i).mean()
+                for week, dfweek in partitions.split(depth)]
 
     def plot_tidal_ssc(self, intervals=None):
         """
@@ -456,16 +1060,12 @@ class Device(object):
         tidal_vars = ["hours", "u", "ssc", "H", "depth_00", "T"]
 
         if self.df_tidal is None:
-            tdelta = pd.Timedelta("300s")
-            df_tidal = pd.DataFrame()
-            for interval in intervals:
-                df_int = self.df_avg[interval[0]:interval[1]]
-                mid = df_int[df_int["Tide"] == "Ebb"].head(1).index[0] - tdelta
-                df_int["hours"] = df_int.apply(
-                    lambda r: get_hours(r, mid),
-                    axis=1)
-                df_tidal = df_tidal.append(df_int[tidal_vars])
-                df_tidal["ssc"] = pd.to_numeric(df_tidal["ssc"])
+            # hours from high water of each tidal cycle, see set_tide
+            self.set_tide()
+            mask = masks.get_intervals_mask(self.df_avg.index, intervals)
+            df_tidal = self.df_avg.loc[mask].rename(
+                columns={"hw_hours": "hours"})[tidal_vars]
+            df_tidal["ssc"] = pd.to_numeric(df_tidal["ssc"])
             self.df_tidal = df_tidal
         plotter.plot_tidal_u_ssc(self.df_tidal, intervals)
 
@@ -494,14 +1094,3 @@ class Device(object):
                 df_tidal["site"] = self.site
                 self.df_tidal = df_tidal
         return self.df_tidal
-
-
-def get_hours(row, mid_value):
-    """
-    Get signed difference, in seconds, between row index (name)
-    and given mid_value timestamp
-    """
-    if (row.name < mid_value):
-        return -(mid_value - row.name).total_seconds()/3600
-    else:
-        return (row.name - mid_value).total_seconds()/3600
@@ -0,0 +1,90 @@
+import numpy as np
+from scipy.constants import pi as PI
+from scipy.constants import g as G
+
+
+def fenton_mckee(T, h):
+    """
+    Explicit approximation of the wavelength for wave period T [s] in
+    water depth h [m], accurate to ~1.5%.
+    Fenton & McKee (1990)
+
+    Math: lambda = lambda0 * tanh((2*PI*sqrt(h/G)/T)^(3/2))^(2/3)
+    """
+    T = np.asarray(T, dtype=float)
+    h = np.asarray(h, dtype=float)
+    L0 = (G / (2 * PI)) * (T ** 2)  # deep water wavelength
+    with np.errstate(invalid="ignore"):
+        return L0 * np.tanh(
+            ((2 * PI * np.sqrt(h / G)) / T) ** 1.5) ** (2 / 3)
+
+
+def solve(T, h, tol=1e-6, max_iter=50):
+    r"""
+    Solves the dispersion relation for arrays of wave periods and depths.
+    Newton iteration on the wave number, starting from the Fenton & McKee
+    approximation, usually converges in two or three iterations.
+
+    Math: (2*PI/T)^2 = G * k * tanh(k*h)
+    https://en.wikipedia.org/wiki/Dispersion_(water_waves)
+
+    Parameters
+    ----------
+    T : array_like
+        Wave period [s]
+    h : array_like
+        Water depth [m], broadcast against T
+    tol : float
+        Tolerance on wavelength between iterations [m]
+    max_iter : int
+        Maximum number of Newton iterations
+
+    Returns
+    -------
+    (L, k, converged) arrays: wavelength [m], wave number [rad/m] and
+    boolean mask of converged entries. Invalid entries (non positive or NaN
+    period or depth) are NaN and not converged.
+    """
+    T, h = np.broadcast_arrays(np.asarray(T, dtype=float),
+                               np.asarray(h, dtype=float))
+    L = np.full(T.shape, np.nan)
+    k = np.full(T.shape, np.nan)
+    converged = np.zeros(T.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        todo = (T > 0) & (h > 0) & np.isfinite(T) & np.isfinite(h)
+    w2 = (2 * PI / T[todo]) ** 2
+    hd = h[todo]
+    kn = (2 * PI) / fenton_mckee(T[todo], hd)
+    Ln = (2 * PI) / kn
+    pending = np.ones(kn.shape, dtype=bool)
+    for i in range(max_iter):
+        if not pending.any():
+            break
+        kp, hp = kn[pending], hd[pending]
+        th = np.tanh(kp * hp)
+        f = G * kp * th - w2[pending]
+        df = G * (th + kp * hp * (1 - th ** 2))
+        kp = kp - f / df
+        lp = (2 * PI) / kp
+        done = np.abs(lp - Ln[pending]) <= tol
+        kn[pending] = kp
+        Ln[pending] = lp
+        pending[pending] = ~done
+    k[todo] = kn
+    L[todo] = Ln
+    converged[todo] = ~pending
+    return L, k, converged
+
+
+def wavelength(T, h, tol=1e-6, max_iter=50):
+    """
+    Wavelength [m] for given wave period T [s] and water depth h [m]
+    """
+    return solve(T, h, tol=tol, max_iter=max_iter)[0]
+
+
+def wavenumber(T, h, tol=1e-6, max_iter=50):
+    """
+    Wave number k [rad/m] for given wave period T [s] and water depth h [m]
+    """
+    return solve(T, h, tol=tol, max_iter=max_iter)[1]
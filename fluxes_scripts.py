@@ -1,8 +1,9 @@
 from adcp import Aquadopp, RDI, Signature1000
 from fluxes import calc_flux
+import numpy as np
 import pandas as pd
-from tools import encoder, plotter
-from intervals import DATA_INTERVALS, FLUXES_INTERVALS
+from tools import encoder, masks, plotter
+from intervals import DATA_INTERVALS
 
 
 def calc_fluxes(adcps):
@@ -12,9 +13,11 @@ def calc_fluxes(adcps):
         dfl = None
         if site != "S3":  # no floater
             dfl = encoder.create_device(dbf.site, "floater", "h5")
+        # calc_flux adds its columns to the bedframe df, keep the shared
+        # device's as it is
         calc_flux(
             dfl.df_avg if dfl else None,
-            dbf.df_avg,
+            dbf.df_avg.copy(),
             adcp.df,
             site,
             adcp.HEIGHTS[0:2],
@@ -32,20 +35,22 @@ def net_fluxes():
     total_fluxes = []
     for s in ["S1", "S2", "S3", "S4", "S5"]:
         df = encoder.get_flux_df(s)
-        fluxes = pd.DataFrame(columns=["Date", "Q", "Site"])
-        intervals = DATA_INTERVALS['%s Bedframe' % s]
-        if not intervals:
-            intervals = FLUXES_INTERVALS['%s Bedframe' % s]
-        for i in intervals:
-            dfinterval = df[i[0]:i[1]]
-            q_neg = dfinterval[(dfinterval.Q_dir < 67) | (dfinterval.Q_dir > 247)] * 600
-            q_pos = dfinterval[(dfinterval.Q_dir >= 67) & (dfinterval.Q_dir <= 247)] * 600
-            q_net = q_pos["Q"].abs().sum() - q_neg["Q"].abs().sum()
-            fluxes = fluxes.append({
-                "Date": dfinterval.index[0],
-                "Q": q_net,
-                "Site": s}, ignore_index=True)
-        fluxes = fluxes.set_index("Date")
+        name = '%s Bedframe' % s
+        kind = "data" if DATA_INTERVALS[name] else "fluxes"
+        # net flux of each interval (overlapping ones too, see
+        # masks.get_interval_positions) from cumulative sums
+        first, last = masks.get_interval_positions(df.index, kind, name)
+        q = (df.Q * 600).abs()
+        q_pos = q.where((df.Q_dir >= 67) & (df.Q_dir <= 247), 0)
+        q_neg = q.where((df.Q_dir < 67) | (df.Q_dir > 247), 0)
+        q_net = np.concatenate(
+            [[0], np.cumsum(np.nan_to_num((q_pos - q_neg).values))])
+        found = last > first  # intervals without data left out
+        fluxes = pd.DataFrame({
+            "Q": (q_net[last] - q_net[first])[found],
+            "Site": s},
+            index=df.index[first[found]], columns=["Q", "Site"])
+        fluxes.index.name = "Date"
         total_fluxes.append(fluxes)
     plotter.plot_total_fluxes(total_fluxes)
 
@@ -0,0 +1,90 @@
+import numpy as np
+from functools import lru_cache
+from scipy import signal
+
+from constants import FFT_WORKERS
+
+try:  # scipy >= 1.4, multi-threaded over batches of bursts
+    from scipy.fft import rfft as sp_rfft, irfft as sp_irfft
+except ImportError:  # scipy.fft is numpy's fft function before 1.4
+    sp_rfft = sp_irfft = None
+
+
+@lru_cache(maxsize=32)
+def get_window(n):
+    """
+    Hann window of n samples, cached (read-only)
+    """
+    window = signal.windows.hann(n)
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=32)
+def get_freqs(n, f):
+    """
+    Frequencies [Hz] of a n samples signal sampled at f Hz, cached
+    (read-only): (rfft frequencies, positive frequencies as
+    scipy.fftpack.fftfreq(n)[fftfreq > 0])
+    """
+    rfreqs = np.fft.rfftfreq(n, d=1/f)
+    freqs = np.fft.fftfreq(n, d=1/f)
+    freqs = freqs[freqs > 0]
+    rfreqs.flags.writeable = False
+    freqs.flags.writeable = False
+    return rfreqs, freqs
+
+
+def rfft(x, workers=FFT_WORKERS):
+    """
+    Real FFT along the last axis of x
+    """
+    if sp_rfft is not None:
+        return sp_rfft(x, axis=-1, workers=workers)
+    return np.fft.rfft(x, axis=-1)
+
+
+def irfft(x, n, workers=FFT_WORKERS):
+    """
+    Inverse of rfft, n samples
+    """
+    if sp_irfft is not None:
+        return sp_irfft(x, n, axis=-1, workers=workers)
+    return np.fft.irfft(x, n, axis=-1)
+
+
+class Spectrum(object):
+    r"""
+    Fourier spectrum of a Hann-windowed burst (1-D) or stack of bursts
+    (2-D, one burst per row). Windows and frequencies are cached per burst
+    length and sampling frequency.
+
+    Parameters
+    ----------
+    x : array_like
+        Detrended signal, e.g. hydrostatic depth [m]
+    f : int
+        Signal frequency [Hz]
+    """
+
+    def __init__(self, x, f):
+        x = np.asarray(x, dtype=float)
+        self.n = x.shape[-1]
+        self.f = f
+        self.rfreqs, self.freqs = get_freqs(self.n, f)
+        self.s_fft = rfft(x * get_window(self.n))
+        self.pwr = np.abs(self.s_fft)
+        # peak index is used on positive frequencies only, as BurstFourier
+        # always did with the full complex spectrum
+        idx = np.argmax(self.pwr, axis=-1)
+        self.pf = self.freqs[idx]  # peak freq
+        self.ppwr = np.take_along_axis(
+            self.pwr, np.expand_dims(idx, -1), -1)[..., 0]  # peak power
+
+    def filtered(self):
+        """
+        Inverse FFT of the spectrum without frequencies over peak freq
+        """
+        s_fft = self.s_fft.copy()
+        s_fft[self.rfreqs > np.expand_dims(self.pf, -1)] = 0
+        return irfft(s_fft, self.n)
@@ -1,15 +1,28 @@
 import fire
 import logging
 
-from constants import (SITES, INST_TYPES, EVENT_DATES,
+from constants import (SITES, INST_TYPES, EVENT_DATES, DEVICES,
                        POSTER_DATES, CALM_EVENT_DATES, PRESO_DATES)
-from tools import plotter, encoder, structure, stats, station
+from tools import (plotter, encoder, structure, stats, station,
+                   calibration)
+from tools.cache import BurstCache
+from tools.registry import REGISTRY
 import maps
 
 
 class Muddy(object):
     """" Main Fire class """
 
+    def __init__(self, memory_budget=None, compact=False):
+        """
+        Devices are shared within a run (see tools.registry), raw data
+        of the least recently used ones released over memory_budget [MB].
+        If compact, devices data is float32 with categorical labels.
+        """
+        if memory_budget is not None:
+            REGISTRY.budget = int(memory_budget * 1024**2)
+        encoder.set_compact(compact)
+
     def plot_OBS_calibration(self):
         """ Generate OBS calibration plots """
         plotter.plot_obs_calibration()
@@ -17,10 +30,11 @@ class Muddy(object):
     def daily_plots(self, origin="h5", site="all", dtype="floater"):
         """ Generate daily plots """
         if isinstance(origin, str):
-            if origin not in ["h5", "rsk"]:
-                raise ValueError("Origin 'h5' or 'rsk' value expected.")
+            if origin not in ["h5", "rsk", "parquet"]:
+                raise ValueError(
+                    "Origin 'h5', 'rsk' or 'parquet' value expected.")
         else:
-            raise TypeError("Origin 'h5' or 'rsk' value expected.")
+            raise TypeError("Origin 'h5', 'rsk' or 'parquet' value expected.")
         if site not in (SITES + ["all"]):
             raise ValueError("String 'S(n)' n being 1 to 5 expected.")
         if dtype not in INST_TYPES:
@@ -49,13 +63,81 @@ class Muddy(object):
                 for d in encoder.create_devices_by_type(t, "h5"):
                     d.plot_avg()
 
+    def avg_data(self, site="all", dtype="bedframe", method="welch",
+                 batch=False, workers=None, cache=True, incremental=False):
+        """
+        (Re)calculate and save burst-averaged data, bursts U, T and H
+        calculated by a pool of workers processes if workers > 1.
+        Bursts already in the burst cache are not calculated again.
+        If incremental, only raw data appended since the last averaged
+        burst is averaged (see Device.update_df_avg).
+        """
+        if site not in (SITES + ["all"]):
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        if dtype not in INST_TYPES:
+            raise ValueError("Type floater or bedframe expected.")
+        bcache = BurstCache() if cache else None
+        if site != "all":  # just one instrument
+            devs = [encoder.create_device(site, dtype, "h5", workers=workers,
+                                          cache=bcache)]
+        else:
+            devs = encoder.create_devices_by_type(dtype, "h5",
+                                                  workers=workers,
+                                                  cache=bcache)
+        for d in devs:
+            if incremental:
+                d.update_df_avg(save=True, method=method, batch=batch)
+            else:
+                d.set_df_avg(save=True, method=method, batch=batch)
+        if bcache is not None:
+            bcache.close()
+
+    def calibrate_ssc(self, site="all", dtype="floater", source="constants",
+                      curve="linear", degree=2, points=None):
+        """
+        Recalculate and save SSC with the OBS calibration curve ('linear'
+        or 'poly' of given degree) of the constants T/SSC values or of the
+        mat calibration file (first points if given), without
+        recalculating bursts
+        """
+        if site not in (SITES + ["all"]):
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        if dtype not in INST_TYPES:
+            raise ValueError("Type floater or bedframe expected.")
+        for d in DEVICES:
+            if d["type"] == dtype and site in [d["site"], "all"]:
+                conf = {"source": source, "curve": curve, "degree": degree,
+                        "points": points}
+                cal = calibration.from_device(dict(d, calibration=conf))
+                # float64 data, as saved (see Device.set_calibration)
+                dev = encoder.create_device(d["site"], dtype, "h5",
+                                            compact=False)
+                dev.set_calibration(cal, save=True)
+                print("%s set for %s" % (str(cal), str(dev)))
+
+    def invalidate_cache(self, site="all", dtype="bedframe", method=None):
+        """ Remove bursts results from the burst cache """
+        if site not in (SITES + ["all"]):
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        if dtype not in INST_TYPES:
+            raise ValueError("Type floater or bedframe expected.")
+        bcache = BurstCache()
+        removed = 0
+        for d in DEVICES:
+            if d["type"] == dtype and site in [d["site"], "all"]:
+                removed += bcache.invalidate(file=d["file"], method=method)
+        print("%d bursts removed from %s" % (removed, str(bcache)))
+        bcache.close()
+
     def ssc_u_plots(self, site="all", dtype="bedframe"):
         if site not in (SITES + ["all"]):
             raise ValueError("String 'S(n)' n being 1 to 5 expected.")
         if dtype not in INST_TYPES:
             raise ValueError("Type floater or bedframe expected.")
         if site != "all":  # just one instrument
-            d = encoder.create_device(site, dtype, "h5")
+            # floaters get the bedframe u added, not shared
+            d = encoder.create_device(site, dtype, "h5",
+                                      shared=dtype != "floater")
             # if floater lets grab wave orbital velocity from bedframe
             if dtype == "floater":
                 dbf = encoder.create_device(site, "bedframe", "h5")
@@ -63,7 +145,8 @@ class Muddy(object):
             d.plot_ssc_u()
         else:
             for t in INST_TYPES:  # all instruments
-                for d in encoder.create_devices_by_type(t, "h5"):
+                for d in encoder.create_devices_by_type(
+                        t, "h5", shared=t != "floater"):
                     if t == "floater":
                         dbf = encoder.create_device(d.site, "bedframe", "h5")
                         d.df_avg["u"] = dbf.df_avg["u"]
@@ -155,7 +238,8 @@ class Muddy(object):
         start = CALM_EVENT_DATES["start"]
         end = CALM_EVENT_DATES["end"]
         title = "%s Event from %s to %s" % (dtype, start, end)
-        devs = encoder.create_devices_by_type(dtype, "h5")
+        # averaged data is cut to the event, not shared
+        devs = encoder.create_devices_by_type(dtype, "h5", shared=False)
         for d in devs:
             d.df_avg = d.df_avg[
                 (d.df_avg.index >= start) & (d.df_avg.index < end)
@@ -194,8 +278,7 @@ class Muddy(object):
         for d in devs:
             devs_dfs.append(d.df_avg[(d.df_avg.index >= start) &
                                      (d.df_avg.index < end)])
-            dflux = encoder.get_flux_df(d.site)
-            dfflux = dflux[(dflux.index >= start) & (dflux.index < end)]
+            dfflux = encoder.get_flux_df(d.site, start=start, end=end)
             fluxes.append(dfflux)
             print(dfflux.Q.max())
         rivers = station.get_rivers(start=start, end=end)
@@ -223,8 +306,23 @@ class Muddy(object):
         plotter.plot_velocities_series(
             dfadcps, dfwind, dfrain, dfpress, rivers)
 
-    def stats(self):
-        stats.basic_stats().to_csv('./data/stats.csv')
+    def stats(self, by=None):
+        """
+        Basic stats per device (and tide, storm or calm interval, or week)
+        from averaged data, ./data/stats.csv (stats_<by>.csv)
+        """
+        if by is not None and by not in stats.GROUPS:
+            raise ValueError("By 'tide', 'storm', 'calm' or 'week' expected.")
+        if by is None:
+            stats.basic_stats().to_csv('./data/stats.csv')
+        else:
+            stats.basic_stats(by).to_csv('./data/stats_%s.csv' % by)
+
+    def memory_report(self, origin="h5"):
+        """ Memory saved per device by compact dtypes """
+        if origin not in ["h5", "parquet"]:
+            raise ValueError("Origin 'h5' or 'parquet' value expected.")
+        print(stats.memory_report(origin).to_string(index=False))
 
     def map_plots(self):
         maps.plot_transect()
@@ -240,17 +338,90 @@ class Muddy(object):
     def river_plot(self):
         station.plot_river_flows()
 
-    def RSKtoH5(self, site="all", dtype="floater"):
-        """ Store RSK data in h5 """
+    def RSKtoH5(self, site="all", dtype="floater", start=None, end=None,
+                chunksize=500000, append=False, overwrite=False):
+        """
+        Store RSK data in h5, streamed chunksize samples at a time.
+        Existing h5 files are kept unless overwrite. Only from start to
+        end dates if given, added to the h5 data (append required,
+        samples after the last one stored only).
+        """
+        if site not in SITES + ["all"]:
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        for d in DEVICES:
+            if ((site == "all" or (d["site"] == site and d["type"] == dtype))
+                    and d["type"] in INST_TYPES):
+                nrows = encoder.rsk_to_H5(d, start=start, end=end,
+                                          chunksize=chunksize, append=append,
+                                          overwrite=overwrite)
+                if nrows is None:
+                    print("h5 file of %s %s exists, kept (see overwrite)" %
+                          (d["site"], d["type"]))
+                else:
+                    print("%d samples stored for %s %s" %
+                          (nrows, d["site"], d["type"]))
+
+    def H5toTable(self, site="all", dtype="bedframe"):
+        """
+        Rewrite H5 data files in table format, chunked and queryable (to
+        stream bursts, read columns and appended rows only)
+        """
+        if site not in SITES + ["all"]:
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        if site != "all":  # just one site (1 to 5)
+            d = encoder.create_device(site, dtype, "h5")
+            d.save_H5_table()
+        else:
+            for t in INST_TYPES:  # all instruments
+                for d in encoder.create_devices_by_type(t, "h5"):
+                    d.save_H5_table()
+
+    def H5toMemmap(self, site="all", dtype="bedframe"):
+        """
+        Store H5 raw data in float32 memory-mapped sample stores, bursts
+        are then sliced from them instead of scanning the dataframe
+        """
         if site not in SITES + ["all"]:
             raise ValueError("String 'S(n)' n being 1 to 5 expected.")
         if site != "all":  # just one site (1 to 5)
-            d = encoder.create_device(site, dtype, "rsk")
-            d.save_H5(avg=False)
+            encoder.create_device(site, dtype, "h5").save_memmap()
+        else:
+            for d in encoder.create_devices_by_type(dtype, "h5"):
+                d.save_memmap()
+
+    def H5toParquet(self, site="all", dtype="bedframe", fluxes=False):
+        """
+        Store H5 data (and fluxes) in parquet datasets partitioned by day,
+        to read only the days and columns needed (requires pyarrow)
+        """
+        if site not in SITES + ["all"]:
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        if site != "all":  # just one site (1 to 5)
+            d = encoder.create_device(site, dtype, "h5")
+            d.save_parquet()
+            if fluxes:
+                encoder.save_flux_parquet(site)
         else:
             for t in INST_TYPES:  # all instruments
-                for d in encoder.create_devices_by_type(t, "rsk"):
-                    d.save_H5(avg=False)
+                for d in encoder.create_devices_by_type(t, "h5"):
+                    d.save_parquet()
+            if fluxes:
+                for s in SITES:
+                    encoder.save_flux_parquet(s)
+
+    def H5toPyramid(self, site="all", dtype="bedframe"):
+        """
+        Store rollups (mean, std, min, max, count) of raw and averaged
+        data at PYRAMID_LEVELS resolutions, plots read them instead of
+        resampling the data
+        """
+        if site not in SITES + ["all"]:
+            raise ValueError("String 'S(n)' n being 1 to 5 expected.")
+        if site != "all":  # just one site (1 to 5)
+            encoder.create_device(site, dtype, "h5").save_pyramid()
+        else:
+            for d in encoder.create_devices_by_type(dtype, "h5"):
+                d.save_pyramid()
 
     def create_struct(self):
         structure.create_structure()
@@ -0,0 +1,165 @@
+import numpy as np
+import os
+import pandas as pd
+
+
+def burst_table(t, interval):
+    r"""
+    Offset table of consecutive bursts (windows of interval seconds) of
+    sorted int64 timestamps t [ns].
+
+    Returns (t0, offsets, lengths): start of the first burst [ns], t
+    floored to interval, and for every burst from t0 on (bursts without
+    samples included) position of its first sample in t and number of
+    samples. Burst n starts at t0 + n * interval.
+    """
+    t = np.asarray(t, dtype=np.int64)
+    step = int(interval) * 10**9
+    if len(t) == 0:
+        empty = np.array([], dtype=np.int64)
+        return 0, empty, empty
+    t0 = (t[0] // step) * step
+    ids = (t - t0) // step
+    lengths = np.bincount(ids).astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return int(t0), offsets.astype(np.int64), lengths
+
+
+class BurstIndex(object):
+    r"""
+    Burst index of a device raw data: sorted int64 timestamps [ns] of the
+    dataframe index, burst boundaries (see burst_table) and number of
+    valid samples (no NaN) among the first sr of each burst.
+    Bursts and any other windows are located by position, no scan of the
+    dataframe.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        int64 timestamps [ns] of the dataframe index
+    tz : str
+        timezone of the dataframe index, None if naive
+    interval : int
+        Interval between bursts [s]
+    sr : int
+        Sampling rate (samples per burst)
+    t0 : int
+        Start of the first burst [ns]
+    offsets, lengths, counts : numpy.ndarray
+        Position of the first sample, number of samples and number of
+        valid samples (first sr only) of each burst
+    """
+
+    def __init__(self, t, tz, interval, sr, t0, offsets, lengths, counts):
+        self.t = t
+        self.tz = tz
+        self.interval = interval
+        self.sr = sr
+        self.t0 = t0
+        self.offsets = offsets
+        self.lengths = lengths
+        self.counts = counts
+
+    @classmethod
+    def build(cls, df, interval, sr, columns=None):
+        """
+        Burst index of df, valid samples being rows without NaN in
+        columns (all columns if None)
+        """
+        t = df.index.asi8
+        t0, offsets, lengths = burst_table(t, interval)
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        valid = ~np.isnan(df.values.astype(float)).any(axis=1)
+        ids = np.repeat(np.arange(len(offsets)), lengths)
+        first = (np.arange(len(t)) - offsets[ids]) < sr
+        counts = np.bincount(ids, weights=valid & first,
+                             minlength=len(offsets)).astype(np.int64)
+        tz = None if df.index.tz is None else str(df.index.tz)
+        return cls(t, tz, interval, sr, t0, offsets, lengths, counts)
+
+    @classmethod
+    def load(cls, path, df, interval, sr):
+        """
+        Burst index saved in path, None if missing or not for df
+        (different rows, first or last timestamp, interval or sr)
+        """
+        if not os.path.isfile(path):
+            return None
+        data = np.load(path)
+        t = df.index.asi8
+        if (len(t) == 0 or data["nrows"] != len(t) or
+                data["first"] != t[0] or data["last"] != t[-1] or
+                data["interval"] != interval or data["sr"] != sr):
+            return None
+        tz = None if df.index.tz is None else str(df.index.tz)
+        return cls(t, tz, interval, sr, int(data["t0"]), data["offsets"],
+                   data["lengths"], data["counts"])
+
+    def save(self, path):
+        """ Save burst boundaries and counts (npz) """
+        np.savez(path,
+                 nrows=len(self.t),
+                 first=self.t[0] if len(self.t) else 0,
+                 last=self.t[-1] if len(self.t) else 0,
+                 interval=self.interval,
+                 sr=self.sr,
+                 t0=self.t0,
+                 offsets=self.offsets,
+                 lengths=self.lengths,
+                 counts=self.counts)
+
+    def get_ns(self, date):
+        """ int64 [ns] of date, naive dates being in the index timezone """
+        date = pd.Timestamp(date)
+        if date.tz is None and self.tz is not None:
+            date = date.tz_localize(self.tz)
+        return date.value
+
+    def _position(self, ns):
+        """
+        Position of the first row at or after ns [ns]: straight from the
+        burst boundaries if ns is a burst start, binary search otherwise
+        """
+        bid, rem = divmod(ns - self.t0, self.interval * 10**9)
+        if rem == 0:
+            if bid < 0:
+                return 0
+            if bid >= len(self.offsets):
+                return len(self.t)
+            return int(self.offsets[bid])
+        return int(np.searchsorted(self.t, ns))
+
+    def locate(self, start, end):
+        """
+        Positions [first, last) of the rows in [start, end), O(1) for
+        windows on burst boundaries (e.g. a burst, a day)
+        """
+        return (self._position(self.get_ns(start)),
+                self._position(self.get_ns(end)))
+
+    def get_valid(self):
+        """
+        Boolean mask of valid bursts: at least sr/2 samples, no NaN
+        among the first sr (see batch.pack_bursts)
+        """
+        n = np.minimum(self.lengths, self.sr)
+        return (n >= (self.sr / 2)) & (self.counts == n)
+
+    def get_starts(self):
+        """ Start dates of all bursts """
+        index = pd.to_datetime(
+            self.t0 + np.arange(len(self.offsets), dtype=np.int64) *
+            self.interval * 10**9, utc=True)
+        if self.tz is None:
+            return index.tz_localize(None)
+        return index.tz_convert(self.tz)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __str__(self):
+        return "Burst index of %d bursts" % len(self.offsets)
+
+    def unicode(self):
+        return self.__str__()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import numpy as np
+import os
+import sqlite3
+import time
+
+from constants import CACHE_PATH, CACHE_MAX_ENTRIES
+
+CACHE_VERSION = 3  # bump when burst calculations change
+
+
+def params_hash(**params):
+    """
+    Hash of the burst analysis parameters (sampling, method options...)
+    """
+    params["version"] = CACHE_VERSION
+    dump = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(dump.encode("utf-8")).hexdigest()
+
+
+def burst_digests(values, offsets, lengths):
+    """
+    Hash of each burst input samples, bursts being rows
+    offsets[i]:offsets[i] + lengths[i] of values
+    """
+    values = np.ascontiguousarray(values)
+    return [hashlib.sha1(values[o:o + n].tobytes()).hexdigest()
+            for o, n in zip(offsets, lengths)]
+
+
+class BurstCache(object):
+    r"""
+    On-disk (sqlite) cache of burst results U, T and H
+
+    Each burst is keyed by device file, burst start, method and hash of
+    the analysis parameters. The hash of its input samples is stored along,
+    so bursts whose data changed (e.g. edited DATA_INTERVALS) are
+    recalculated. Least recently used bursts are evicted when the cache
+    holds more than max_entries.
+
+    Parameters
+    ----------
+    path : str
+        sqlite database file
+    max_entries : int
+        Maximum number of bursts kept
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS bursts ("
+            "file TEXT, start INTEGER, method TEXT, params TEXT, "
+            "digest TEXT, u REAL, T REAL, H REAL, used REAL, "
+            "PRIMARY KEY (file, start, method, params))")
+        self.conn.commit()
+
+    def get(self, file, method, params, starts, digests):
+        """
+        Cached u, T, H for given bursts
+
+        Returns (uth, found): 2-D array (n_bursts x 3), NaN if not found,
+        and boolean mask of bursts found with the same input digest
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        uth = np.full((len(starts), 3), np.nan)
+        found = np.zeros(len(starts), dtype=bool)
+        rows = self.conn.execute(
+            "SELECT start, digest, u, T, H FROM bursts "
+            "WHERE file = ? AND method = ? AND params = ?",
+            (file, method, params)).fetchall()
+        if not rows:
+            return uth, found
+        cached = {r[0]: r[1:] for r in rows}
+        for i, (start, digest) in enumerate(zip(starts, digests)):
+            r = cached.get(int(start))
+            if r is not None and r[0] == digest:
+                uth[i] = r[1:]
+                found[i] = True
+        # only bursts found are used, see evict
+        used = time.time()
+        self.conn.executemany(
+            "UPDATE bursts SET used = ? "
+            "WHERE file = ? AND start = ? AND method = ? AND params = ?",
+            [(used, file, int(start), method, params)
+             for start in starts[found]])
+        self.conn.commit()
+        return uth, found
+
+    def put(self, file, method, params, starts, digests, uth):
+        """
+        Store u, T, H (2-D array n_bursts x 3) of given bursts
+        """
+        used = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO bursts "
+            "(file, start, method, params, digest, u, T, H, used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(file, int(s), method, params, d,
+              float(r[0]), float(r[1]), float(r[2]), used)
+             for s, d, r in zip(starts, digests, uth)])
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used bursts over self.max_entries
+        """
+        count = len(self)
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM bursts WHERE rowid IN ("
+                "SELECT rowid FROM bursts ORDER BY used ASC LIMIT ?)",
+                (count - self.max_entries,))
+            self.conn.commit()
+
+    def invalidate(self, file=None, method=None):
+        """
+        Remove cached bursts of given device file and/or method,
+        everything if none given. Returns number of bursts removed.
+        """
+        query = "DELETE FROM bursts"
+        conditions = []
+        args = []
+        if file is not None:
+            conditions.append("file = ?")
+            args.append(file)
+        if method is not None:
+            conditions.append("method = ?")
+            args.append(method)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        removed = self.conn.execute(query, args).rowcount
+        self.conn.commit()
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM bursts").fetchone()[0]
+
+    def __str__(self):
+        return "Burst cache %s" % self.path
+
+    def unicode(self):
+        return self.__str__()
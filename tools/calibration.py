@@ -0,0 +1,130 @@
+import numpy as np
+import scipy.io as sio
+
+from constants import OBS_CALIBRATION_PATH
+
+CURVES = ["linear", "poly"]
+
+
+def get_mat_path(dtype, file):
+    """
+    OBS calibration file of the device dtype/file
+    e.g. ./ml/OBS_calibration/floater/CalData_C066010.mat
+    """
+    return "%s%s/CalData_C%s.mat" % (
+        OBS_CALIBRATION_PATH, dtype, file.split("_")[0])
+
+
+def get_rising(T, SSC):
+    """
+    Rising branch of a calibration set, points up to the maximum
+    turbidity: the OBS response folds back past saturation, the same
+    turbidity reached again at higher SSC
+    """
+    T = np.asarray(T, dtype=float)
+    SSC = np.asarray(SSC, dtype=float)
+    end = np.argmax(T) + 1 if len(T) else 0
+    return T[:end], SSC[:end]
+
+
+def load_mat(dtype, file, points=None, rising=True):
+    """
+    Turbidity [NTU] and SSC [mg/L] arrays of the OBS calibration of the
+    device dtype/file, only its rising branch (see get_rising) unless
+    not rising, and only the first points if given
+    """
+    serial = "C%s" % file.split("_")[0]
+    data = sio.loadmat(get_mat_path(dtype, file))
+    T = data["%s_Responce" % serial].ravel().astype(float)
+    SSC = data["%s_SSCvalues" % serial].ravel().astype(float)
+    if rising:
+        T, SSC = get_rising(T, SSC)
+    return T[:points], SSC[:points]
+
+
+def from_device(device):
+    """
+    Calibration of a device dict of constants.DEVICES. Optional keys:
+    "calibration" dict of source ("constants" T/SSC lists or "mat" file),
+    curve, degree and points (of the mat file), and "ssc_saturated_value".
+    Only the rising branch of the calibration set is used (see get_rising).
+    """
+    conf = device.get("calibration", {})
+    if conf.get("source", "constants") == "mat":
+        T, SSC = load_mat(device["type"], device["file"],
+                          conf.get("points"))
+    else:
+        T, SSC = get_rising(device["T"], device["SSC"])
+    return Calibration(
+        T,
+        SSC,
+        curve=conf.get("curve", "linear"),
+        degree=conf.get("degree", 2),
+        saturated=device.get("ssc_saturated_value"))
+
+
+class Calibration(object):
+    r"""
+    OBS calibration curve, turbidity to suspended sediment concentration
+
+    Parameters
+    ----------
+    T : array_like
+        Turbidity calibration values [NTU]
+    SSC : array_like
+        Suspended sediment concentration [mg/L]
+        Same length as T
+        T strictly increasing for the linear curve (see get_rising)
+    curve : str
+        'linear' (piecewise-linear interpolation of T with SSC) or
+        'poly' (least squares polynomial of given degree)
+    degree : int
+        Degree of the polynomial curve
+    saturated : float
+        SSC [mg/L] the instrument saturates at, converted values reaching
+        it are set to NaN. Not used if None
+    """
+
+    def __init__(self, T, SSC, curve="linear", degree=2, saturated=None):
+        if curve not in CURVES:
+            raise ValueError("Unknown calibration curve %s" % curve)
+        self.T = np.asarray(T, dtype=float)
+        self.SSC = np.asarray(SSC, dtype=float)
+        if len(self.T) != len(self.SSC):
+            raise ValueError("T and SSC must have the same length")
+        if curve == "linear" and np.any(np.diff(self.T) <= 0):
+            raise ValueError("T must be strictly increasing for the linear "
+                             "curve (see get_rising)")
+        self.curve = curve
+        self.degree = degree
+        self.saturated = saturated
+        self.coefs = None
+        if curve == "poly":
+            self.coefs = np.polyfit(self.T, self.SSC, degree)
+
+    def convert(self, turbidity):
+        """
+        SSC [mg/L] of a whole turbidity [NTU] array (NaN kept as NaN).
+        Values out of the calibration range are held at the range ends,
+        as numpy.interp does.
+        """
+        turbidity = np.asarray(turbidity, dtype=float)
+        if self.curve == "linear":
+            ssc = np.interp(turbidity, self.T, self.SSC)
+        else:
+            ssc = np.clip(np.polyval(self.coefs, turbidity),
+                          self.SSC.min(),
+                          self.SSC.max())
+        if self.saturated is not None:
+            with np.errstate(invalid="ignore"):
+                ssc[ssc >= self.saturated] = np.nan
+        return ssc
+
+    def __str__(self):
+        if self.curve == "poly":
+            return "Calibration poly degree %d, %d points" % (
+                self.degree, len(self.T))
+        return "Calibration linear, %d points" % len(self.T)
+
+    def unicode(self):
+        return self.__str__()
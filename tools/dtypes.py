@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+FLOAT_DTYPE = np.float32  # sensor channels in compact frames
+CATEGORIES = {"Tide": ["Ebb", "Flood"]}  # known labels, others inferred
+
+
+def compact(df):
+    """
+    Compact copy of df: float columns as float32 and label (object)
+    columns as categoricals. The time index is kept as it is, a
+    DatetimeIndex being int64 [ns] already.
+    """
+    columns = {}
+    for c in df.columns:
+        if df[c].dtype == np.float64:
+            columns[c] = df[c].astype(FLOAT_DTYPE)
+        elif df[c].dtype == object:
+            columns[c] = df[c].astype(
+                pd.CategoricalDtype(CATEGORIES.get(c)))
+    if not columns:
+        return df
+    df = df.copy()
+    for c, values in columns.items():
+        df[c] = values
+    return df
+
+
+def expand(df):
+    """
+    Copy of a compact df (see compact) with float64 and object columns
+    again, df itself if it has no float32 or categorical columns
+    """
+    columns = {}
+    for c in df.columns:
+        if df[c].dtype == FLOAT_DTYPE:
+            columns[c] = df[c].astype(np.float64)
+        elif isinstance(df[c].dtype, pd.CategoricalDtype):
+            columns[c] = df[c].astype(object)
+    if not columns:
+        return df
+    df = df.copy()
+    for c, values in columns.items():
+        df[c] = values
+    return df
+
+
+def get_memory(df):
+    """ Memory used by df, index included [bytes] """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def get_full_memory(df):
+    """
+    Memory df would use with float64 and object (string) columns
+    [bytes], without converting it
+    """
+    memory = df.index.memory_usage(deep=True)
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            memory += df[c].astype(object).memory_usage(
+                index=False, deep=True)
+        elif np.issubdtype(df[c].dtype, np.floating):
+            memory += len(df) * 8
+        else:
+            memory += df[c].memory_usage(index=False, deep=True)
+    return int(memory)
+
+
+def to_hdf(df, path, key="df"):
+    """
+    Save df to a h5 file (fixed format) as float64 and object columns
+    (see expand), so files read the same in and out of compact mode
+    """
+    expand(df).to_hdf(path, key=key, mode="w")
@@ -1,55 +1,180 @@
+import os
 import pandas as pd
 import pyrsktools
 
 from constants import (RAW_PATH, PROCESSED_PATH, H5_PATH,
-                       TIMEZONE, DEVICES, FLUXES_PATH)
+                       TIMEZONE, DEVICES, FLUXES_PATH, PARQUET_FOLDER)
 from device import Device
+from tools import calibration, parquet, storage
+from tools.registry import REGISTRY
 
+COMPACT = False  # compact mode of devices created, see set_compact
 
-def create_devices_by_type(dtype, dformat):
-    """ Create all devices by type floater/bedframe """
-    devices = []
-    for d in DEVICES:
-        if d["type"] == dtype:
-            devices.append(Device(
-                site=d["site"],
-                dtype=d["type"],
-                file=d["file"],
-                f=d["freq"],
-                sr=d["burst_samples"],
-                i=d["interval"],
-                T=d["T"],
-                SSC=d["SSC"],
-                dformat=dformat
-            ))
-    return devices
-
-
-def create_device(site, dtype, origin):
-    """ Create Device from dict values """
+
+def set_compact(compact):
+    """
+    Create devices in compact mode (float32, categoricals) by default
+    (see Device)
+    """
+    global COMPACT
+    COMPACT = compact
+
+
+def create_devices_by_type(dtype, dformat, workers=None, cache=None,
+                           start=None, end=None, columns=None, shared=True,
+                           compact=None):
+    """
+    Create all devices by type floater/bedframe
+    (start, end and columns only for the "parquet" format)
+    """
+    return [create_device(d["site"], dtype, dformat, workers=workers,
+                          cache=cache, start=start, end=end,
+                          columns=columns, shared=shared, compact=compact)
+            for d in DEVICES if d["type"] == dtype]
+
+
+def create_device(site, dtype, origin, workers=None, cache=None,
+                  start=None, end=None, columns=None, shared=True,
+                  compact=None):
+    """
+    Create Device from dict values
+    (start, end and columns only for the "parquet" origin)
+    If shared, the same Device is returned for the same site, type,
+    origin, dates, columns and compact mode within a run
+    (see tools.registry), with the given workers and cache.
+    Compact mode as set_compact if None.
+    """
     d = next(item for item in DEVICES if (item["site"] == site and
                                           item["type"] == dtype))
-    return Device(
-        site=d["site"],
-        dtype=d["type"],
-        file=d["file"],
-        f=d["freq"],
-        sr=d["burst_samples"],
-        i=d["interval"],
-        T=d["T"],
-        SSC=d["SSC"],
-        dformat=origin
-    )
-
-
-def get_flux_df(site, method="bedframe"):
+    if compact is None:
+        compact = COMPACT
+
+    def factory():
+        return Device(
+            site=d["site"],
+            dtype=d["type"],
+            file=d["file"],
+            f=d["freq"],
+            sr=d["burst_samples"],
+            i=d["interval"],
+            T=d["T"],
+            SSC=d["SSC"],
+            dformat=origin,
+            workers=workers,
+            cache=cache,
+            calibration=calibration.from_device(d),
+            start=start,
+            end=end,
+            columns=columns,
+            compact=compact
+        )
+
+    if not shared:
+        return factory()
+    key = (site, dtype, origin, start, end,
+           None if columns is None else tuple(columns), compact)
+    device = REGISTRY.get(key, factory)
+    device.workers = workers
+    device.cache = cache
+    return device
+
+
+def rsk_to_H5(device, start=None, end=None, chunksize=storage.CHUNKSIZE,
+              append=False, overwrite=False):
+    """
+    Stream the processed RSK file of a device dict (constants.DEVICES)
+    into its h5 file (table format), chunksize samples at a time from
+    start to end dates (whole file if None): timezone localization and SSC
+    are applied per chunk, so only one chunk is in memory at once.
+    If append, samples after the last one stored are added to the h5
+    file (e.g. a new download, see Device.update_df_avg), from start if
+    later, created if there is none. Otherwise an existing h5 file is
+    kept unless overwrite, and start/end dates are refused (the device h5
+    file would only hold that window).
+    Returns the number of samples written, None if the h5 file is kept.
+    """
+    rsk_path = "%s%s_processed.rsk" % (PROCESSED_PATH, device["file"])
+    h5_path = "%s%s.h5" % (H5_PATH, device["file"])
+    last = None
+    if not append:
+        if start is not None or end is not None:
+            raise ValueError("Dates only to append to the h5 file, "
+                             "it would hold only that window otherwise.")
+        if os.path.isfile(h5_path) and not overwrite:
+            return None
+    elif os.path.isfile(h5_path):
+        if not storage.is_table(h5_path):
+            raise ValueError("Cannot append to %s, not in table format "
+                             "(see muddy.py H5toTable)." % h5_path)
+        last = storage.get_table_range(h5_path)[1]
+    if last is not None:
+        # RSK dates are naive local dates (see storage.iter_rsk)
+        local_last = last.tz_localize(None)
+        if start is None or pd.Timestamp(start) < local_last:
+            start = local_last
+    cal = calibration.from_device(device)
+
+    def chunks():
+        for df in storage.iter_rsk(rsk_path, start, end, TIMEZONE,
+                                   chunksize):
+            if last is not None and df.index[0] <= last:  # stored already
+                df = df[df.index > last].copy()
+                if not len(df):
+                    continue
+            df["ssc"] = cal.convert(df.turbidity_00.values)
+            yield df
+
+    return storage.append_chunks(h5_path, chunks(), append=append)
+
+
+def get_flux_parquet_path(site, method="bedframe"):
+    return "%s%s/%s_%s" % (FLUXES_PATH, PARQUET_FOLDER, site, method)
+
+
+def save_flux_parquet(site, method="bedframe"):
+    """ Store fluxes h5 data as a parquet dataset partitioned by day """
+    datapath = "%s%s_%s.h5" % (FLUXES_PATH, site, method)
+    parquet.write_dataset(get_flux_parquet_path(site, method),
+                          pd.read_hdf(datapath, "df"))
+
+
+def get_flux_df(site, method="bedframe", start=None, end=None,
+                columns=None):
+    """
+    Fluxes DataFrame, from start to end dates and given columns only.
+    Read from the parquet dataset if there is one (see save_flux_parquet),
+    only the days needed.
+    """
+    ppath = get_flux_parquet_path(site, method)
+    if parquet.available() and os.path.isdir(ppath):
+        return parquet.read_dataset(ppath, start, end, columns)
     datapath = "%s%s_%s.h5" % (FLUXES_PATH, site, method)
-    return pd.read_hdf(datapath, "df")
+    df = pd.read_hdf(datapath, "df")
+    return select_df(df, start, end, columns)
 
 
-def get_df(device, origin):
-    """ Get DataFrame given a device and an origin (filetype RSK or H5)"""
+def select_df(df, start=None, end=None, columns=None):
+    """ Rows of df with index in [start, end), only given columns """
+    if start is not None:
+        df = df[df.index >= start]
+    if end is not None:
+        df = df[df.index < end]
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def get_df(device, origin, start=None, end=None, columns=None):
+    """
+    Get DataFrame given a device and an origin (filetype RSK, H5 or
+    parquet), from start to end dates and given columns only
+    """
     df = None
+    if origin == "parquet":
+        datapath = "%s%s/%s" % (H5_PATH, PARQUET_FOLDER, device["file"])
+        print("Using %s as a dataframe source for %s %s" %
+              (datapath, device["name"], device["type"]))
+        return parquet.read_dataset(datapath, start, end, columns)
     if origin == "h5":
         datapath = "%s%s.h5" % (H5_PATH, device["file"])
         print("Using %s as a dataframe source for %s %s" %
@@ -70,4 +195,4 @@ def get_df(device, origin):
         # timestamp as index, then UTC to NZ
         df = df.set_index("timestamp")
         df.index = df.index.tz_convert(TIMEZONE)
-    return df
+    return select_df(df, start, end, columns)
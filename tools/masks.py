@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+
+from intervals import (DATA_INTERVALS, STORM_INTERVALS, CALM_INTERVALS,
+                       FLUXES_INTERVALS)
+
+INTERVALS = {
+    "data": DATA_INTERVALS,
+    "storm": STORM_INTERVALS,
+    "calm": CALM_INTERVALS,
+    "fluxes": FLUXES_INTERVALS
+}
+
+# intervals are closed, end dates given to the second
+END_RESOLUTION = pd.Timedelta("1s")
+
+
+def compile_intervals(intervals, tz=None):
+    """
+    Sorted, non overlapping int64 [ns] boundaries (starts, ends) of a list
+    of [start, end] date strings in timezone tz. Ends are exclusive, the
+    end second included as label slicing df[start:end] does.
+    """
+    if not intervals:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty
+    starts = np.array([pd.Timestamp(i[0], tz=tz).value for i in intervals],
+                      dtype=np.int64)
+    ends = np.array([(pd.Timestamp(i[1], tz=tz) + END_RESOLUTION).value
+                     for i in intervals], dtype=np.int64)
+    order = np.argsort(starts, kind="mergesort")
+    starts, ends = starts[order], ends[order]
+    # merge overlapping intervals
+    ends = np.maximum.accumulate(ends)
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > ends[:-1]
+    last = np.append(np.flatnonzero(new)[1:] - 1, len(starts) - 1)
+    return starts[new], ends[last]
+
+
+@lru_cache(maxsize=128)
+def get_boundaries(kind, name, tz=None):
+    """
+    Compiled boundaries (see compile_intervals) of the intervals of device
+    name (e.g. 'S1 Bedframe') in INTERVALS[kind], cached.
+    None if the device has no intervals (False or empty), i.e. all data
+    is valid.
+    """
+    intervals = INTERVALS[kind][name]
+    if not intervals:
+        return None
+    return compile_intervals(intervals, tz)
+
+
+def _get_tz(index):
+    return None if index.tz is None else str(index.tz)
+
+
+def _get_ids(index, boundaries):
+    starts, ends = boundaries
+    t = index.asi8
+    ids = np.searchsorted(ends, t, side="right")
+    inside = ids < len(ends)
+    inside[inside] = t[inside] >= starts[ids[inside]]
+    return np.where(inside, ids, -1)
+
+
+def get_interval_ids(index, kind, name):
+    """
+    Number of the (compiled) interval each timestamp of index falls in,
+    -1 if none. All 0 if the device has no intervals.
+    """
+    boundaries = get_boundaries(kind, name, _get_tz(index))
+    if boundaries is None:
+        return np.zeros(len(index), dtype=np.int64)
+    return _get_ids(index, boundaries)
+
+
+def get_mask(index, kind, name):
+    """
+    Boolean mask of the timestamps of index within the intervals of device
+    name in INTERVALS[kind], all True if it has no intervals
+    """
+    return get_interval_ids(index, kind, name) >= 0
+
+
+def get_intervals_mask(index, intervals):
+    """
+    Boolean mask of the timestamps of index within a list of
+    [start, end] date strings (not cached, see get_mask)
+    """
+    boundaries = compile_intervals(intervals, _get_tz(index))
+    return _get_ids(index, boundaries) >= 0
+
+
+def get_interval_positions(index, kind, name):
+    """
+    Positions [first, last) of the rows of a sorted index within each
+    interval of device name in INTERVALS[kind], in the list order and not
+    merged (overlapping intervals share rows), as df[start:end] of each
+    interval would give. Empty arrays if the device has no intervals.
+    """
+    intervals = INTERVALS[kind][name] or []
+    tz = _get_tz(index)
+    starts = np.array([pd.Timestamp(i[0], tz=tz).value for i in intervals],
+                      dtype=np.int64)
+    ends = np.array([(pd.Timestamp(i[1], tz=tz) + END_RESOLUTION).value
+                     for i in intervals], dtype=np.int64)
+    t = index.asi8
+    return np.searchsorted(t, starts), np.searchsorted(t, ends)
+
+
+def select(df, kind, name):
+    """
+    Rows of df within the intervals of device name in INTERVALS[kind]
+    """
+    return df[get_mask(df.index, kind, name)]
+
+
+def clear_cache():
+    """
+    Forget compiled intervals, e.g. after editing INTERVALS
+    """
+    get_boundaries.cache_clear()
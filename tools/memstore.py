@@ -0,0 +1,154 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+
+from tools.burstindex import BurstIndex, burst_table
+from tools.storage import CHUNKSIZE
+
+DTYPE = np.float32  # samples dtype
+META_FILE = "meta.json"
+TIME_FILE = "time.i8"  # int64 UTC timestamps [ns]
+BURSTS_FILE = "bursts.i8"  # burst table, offsets and lengths
+
+
+def write(path, df, interval, chunksize=CHUNKSIZE):
+    """
+    Write the numeric columns of a time indexed df as a sample store in
+    the path folder: one float32 file per column, timestamps and burst
+    table (see burst_table), chunksize rows at a time
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    columns = [c for c in df.columns if np.issubdtype(df[c].dtype,
+                                                      np.number)]
+    t = df.index.asi8
+    t.tofile(os.path.join(path, TIME_FILE))
+    for c in columns:
+        with open(os.path.join(path, "%s.f4" % c), "wb") as fh:
+            for i in range(0, len(df), chunksize):
+                df[c].values[i:i + chunksize].astype(DTYPE).tofile(fh)
+    t0, offsets, lengths = burst_table(t, interval)
+    np.stack([offsets, lengths]).tofile(os.path.join(path, BURSTS_FILE))
+    meta = {
+        "columns": columns,
+        "nrows": len(df),
+        "first": int(t[0]) if len(t) else 0,
+        "last": int(t[-1]) if len(t) else 0,
+        "tz": None if df.index.tz is None else str(df.index.tz),
+        "interval": interval,
+        "t0": t0,
+        "nbursts": len(offsets)}
+    with open(os.path.join(path, META_FILE), "w") as fh:
+        json.dump(meta, fh)
+
+
+class SampleStore(object):
+    r"""
+    Read-only, memory-mapped store of a device samples on disk
+    (see write). Arrays are mapped when first used, so opening a store
+    only reads its metadata, and pages are shared between processes.
+
+    Parameters
+    ----------
+    path : str
+        Store folder
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as fh:
+            meta = json.load(fh)
+        self.columns = meta["columns"]
+        self.nrows = meta["nrows"]
+        self.first = meta.get("first")
+        self.last = meta.get("last")
+        self.tz = meta["tz"]
+        self.interval = meta["interval"]
+        self.t0 = meta["t0"]
+        self.nbursts = meta["nbursts"]
+        self._arrays = {}
+        self._index = None
+
+    def matches(self, nrows, first, last):
+        """
+        Store of the data with nrows rows from first to last int64 [ns]
+        timestamps (stores written before they were kept never match)
+        """
+        return (nrows == self.nrows and
+                (not nrows or (first == self.first and last == self.last)))
+
+    def _map(self, name, dtype, shape):
+        if name not in self._arrays:
+            if not shape[-1]:  # empty files can't be mapped
+                self._arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(
+                    os.path.join(self.path, name), dtype=dtype, mode="r",
+                    shape=shape)
+        return self._arrays[name]
+
+    @property
+    def time(self):
+        return self._map(TIME_FILE, np.int64, (self.nrows,))
+
+    @property
+    def bursts(self):
+        """ 2-D (2 x nbursts) array, burst offsets and lengths """
+        return self._map(BURSTS_FILE, np.int64, (2, self.nbursts))
+
+    def values(self, column):
+        """ float32 samples of column """
+        return self._map("%s.f4" % column, DTYPE, (self.nrows,))
+
+    @property
+    def index(self):
+        """ tools.burstindex.BurstIndex of the store (no valid counts) """
+        if self._index is None:
+            self._index = BurstIndex(
+                self.time, self.tz, self.interval, None, self.t0,
+                self.bursts[0], self.bursts[1], None)
+        return self._index
+
+    def locate(self, start, end):
+        """
+        Positions [first, last) of the samples in [start, end)
+        (see tools.burstindex.BurstIndex.locate)
+        """
+        return self.index.locate(start, end)
+
+    def get_slice(self, start, end, columns=None, n=None):
+        """
+        Zero-copy views of the samples in [start, end), at most n:
+        (int64 timestamps, dict of column float32 arrays)
+        """
+        first, last = self.locate(start, end)
+        if n is not None:
+            last = min(last, first + n)
+        if columns is None:
+            columns = self.columns
+        return (self.time[first:last],
+                {c: self.values(c)[first:last] for c in columns})
+
+    def get_df(self, start, end, columns=None, n=None):
+        """
+        pandas.DataFrame of the samples in [start, end), at most n (a copy
+        of only those samples, see get_slice)
+        """
+        t, values = self.get_slice(start, end, columns, n)
+        index = pd.to_datetime(np.asarray(t), utc=True)
+        if self.tz is not None:
+            index = index.tz_convert(self.tz)
+        else:
+            index = index.tz_localize(None)
+        return pd.DataFrame(values, index=index,
+                            columns=list(values.keys()))
+
+    def __len__(self):
+        return self.nrows
+
+    def __str__(self):
+        return "Sample store %s" % self.path
+
+    def unicode(self):
+        return self.__str__()
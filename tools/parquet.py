@@ -0,0 +1,73 @@
+import os
+import pandas as pd
+import shutil
+
+try:  # optional backend
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+TIME_COLUMN = "timestamp"  # index stored as a column
+PARTITION_COLUMN = "day"  # local date partitions, e.g. day=2017-05-15
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def available():
+    """ pyarrow installed, parquet datasets can be used """
+    return pq is not None
+
+
+def _check():
+    if pq is None:
+        raise ImportError("pyarrow is required for parquet datasets")
+
+
+def write_dataset(path, df):
+    """
+    Write df (time indexed) as a parquet dataset partitioned by day in
+    the path folder, replacing any previous dataset
+    """
+    _check()
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    df = df.rename_axis(TIME_COLUMN).reset_index()
+    df[PARTITION_COLUMN] = df[TIME_COLUMN].dt.strftime(DAY_FORMAT)
+    pq.write_to_dataset(pa.Table.from_pandas(df, preserve_index=False),
+                        path,
+                        partition_cols=[PARTITION_COLUMN])
+
+
+def read_dataset(path, start=None, end=None, columns=None):
+    """
+    Rows of the parquet dataset in path with index in [start, end), only
+    given columns. Only the days from start to end are read.
+    """
+    _check()
+    if not os.path.isdir(path):
+        raise FileNotFoundError("No parquet dataset %s" % path)
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters.append((PARTITION_COLUMN, ">=", start.strftime(DAY_FORMAT)))
+    if end is not None:
+        end = pd.Timestamp(end)
+        filters.append((PARTITION_COLUMN, "<=", end.strftime(DAY_FORMAT)))
+    if columns is not None:
+        columns = [TIME_COLUMN] + [c for c in columns if c != TIME_COLUMN]
+    dataset = pq.ParquetDataset(path, filters=filters or None)
+    df = dataset.read(columns=columns).to_pandas()
+    df = df.set_index(TIME_COLUMN)
+    if PARTITION_COLUMN in df.columns:
+        df = df.drop(columns=[PARTITION_COLUMN])
+    df = df.sort_index(kind="mergesort")
+    tz = df.index.tz
+    if start is not None:
+        if start.tz is None and tz is not None:
+            start = start.tz_localize(tz)
+        df = df[df.index >= start]
+    if end is not None:
+        if end.tz is None and tz is not None:
+            end = end.tz_localize(tz)
+        df = df[df.index < end]
+    return df
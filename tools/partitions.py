@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import weakref
+from collections import OrderedDict
+
+DAY = 24 * 3600 * 10**9  # [ns]
+CACHE_SIZE = 64  # calendar indexes kept, least recently used out
+
+_calendars = OrderedDict()
+
+
+def _get_runs(codes):
+    """ Start positions of runs of equal codes, and the end """
+    starts = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    return np.concatenate([[0], starts, [len(codes)]]).astype(np.int64)
+
+
+def _get_weeks(days):
+    """ ISO week number of each date of days (DatetimeIndex) """
+    try:
+        return np.asarray(days.isocalendar().week, dtype=np.int64)
+    except AttributeError:  # pandas < 1.1
+        return np.asarray(days.week, dtype=np.int64)
+
+
+class CalendarIndex(object):
+    r"""
+    Calendar partitions of a sorted DatetimeIndex: position of the first
+    and last row of each (local) day and week, so partitions are taken as
+    zero-copy slices instead of grouping a frame by index.date or
+    index.week every time. Days and weeks without rows are not there.
+
+    Parameters
+    ----------
+    index : pandas.DatetimeIndex
+        Sorted index
+    """
+
+    def __init__(self, index):
+        if not index.is_monotonic_increasing:
+            raise ValueError("Calendar index of an unsorted index")
+        self.tz = index.tz
+        wall = index.tz_localize(None) if index.tz is not None else index
+        codes = wall.asi8 // DAY
+        bounds = _get_runs(codes)
+        days = pd.to_datetime(codes[bounds[:-1]] * DAY)
+        self.day_bounds = bounds
+        self.days = (days if self.tz is None else days.tz_localize(self.tz))
+        weeks = _get_weeks(days)
+        runs = _get_runs(weeks)
+        self.week_bounds = bounds[runs]
+        self.weeks = weeks[runs[:-1]]
+
+    def iter_days(self):
+        """ Generator of (day, slice of its rows) """
+        for j, day in enumerate(self.days):
+            yield day, slice(self.day_bounds[j], self.day_bounds[j + 1])
+
+    def iter_weeks(self):
+        """ Generator of (ISO week number, slice of its rows) """
+        for j, week in enumerate(self.weeks):
+            yield week, slice(self.week_bounds[j], self.week_bounds[j + 1])
+
+    def get_day(self, day):
+        """ Slice of the rows of day, empty if none """
+        day = pd.Timestamp(day)
+        if day.tz is None and self.tz is not None:
+            day = day.tz_localize(self.tz)
+        j = self.days.searchsorted(day.floor("D"))
+        if j < len(self.days) and self.days[j] == day.floor("D"):
+            return slice(self.day_bounds[j], self.day_bounds[j + 1])
+        return slice(0, 0)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __str__(self):
+        return "Calendar index of %d days, %d weeks" % (
+            len(self.days), len(self.weeks))
+
+    def unicode(self):
+        return self.__str__()
+
+
+def _forget(key, ref):
+    if key in _calendars and _calendars[key][0] is ref:
+        del _calendars[key]
+
+
+def get_calendar(index):
+    """
+    Calendar index of index, built once and cached while index is in use
+    (any change to a frame rows gives it a new index object). Indexes
+    are weakly referenced, so released frames are not kept alive.
+    """
+    key = id(index)
+    if key in _calendars and _calendars[key][0]() is index:
+        _calendars.move_to_end(key)
+        return _calendars[key][1]
+    calendar = CalendarIndex(index)
+    _calendars[key] = (
+        weakref.ref(index, lambda ref, key=key: _forget(key, ref)), calendar)
+    while len(_calendars) > CACHE_SIZE:
+        _calendars.popitem(last=False)
+    return calendar
+
+
+def split(df, freq="week"):
+    """
+    List of (week number or day, rows) partitions of df, same groups as
+    df.groupby(df.index.week) or df.index.date in time order. Rows are
+    slices of df, copy them before changing them.
+    """
+    calendar = get_calendar(df.index)
+    parts = calendar.iter_weeks() if freq == "week" else calendar.iter_days()
+    return [(key, df.iloc[s]) for key, s in parts]
+
+
+def clear_cache():
+    """ Forget all calendar indexes """
+    _calendars.clear()
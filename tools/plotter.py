@@ -11,7 +11,7 @@ from pandas.plotting import register_matplotlib_converters
 from scipy.stats import linregress
 from windrose import plot_windrose
 
-from tools import encoder, plot_constants
+from tools import encoder, partitions, plot_constants
 from constants import OUTPUT_PATH, VARIABLES, INST_TYPES, ADCP_LEVELS
 
 register_matplotlib_converters()
@@ -1084,7 +1084,7 @@ def plot_ssc_series(devices):
     }
     ddict = {}
     for d in devices:
-        for gdate, df in d.df_avg.groupby(d.df_avg.index.week):
+        for gdate, df in partitions.split(d.df_avg, "week"):
             if d.site not in ddict:
                 ddict[d.site] = []
             ddict[d.site].append(df)
@@ -1243,7 +1243,7 @@ def plot_salinities(floaters, bedframes):
     fig, axes = plt.subplots(ncols=1, nrows=4)  # 4 weeks
     for d in bedframes:
         i = 0
-        for gdate, df in d.df_avg.groupby(d.df_avg.index.week):
+        for gdate, df in partitions.split(d.df_avg, "week"):
             ax = axes[i]
             ax.plot(df.index, df.salinity_00, label=d.site, c=colours[d.site])
             ax.set_yticks([0, 20, 35])
@@ -1257,7 +1257,7 @@ def plot_salinities(floaters, bedframes):
     fig2, axes2 = plt.subplots(ncols=1, nrows=4)  # 4 weeks
     for d in floaters:
         i = 0
-        for gdate, df in d.df_avg.groupby(d.df_avg.index.week):
+        for gdate, df in partitions.split(d.df_avg, "week"):
             ax = axes2[i]
             ax.plot(df.index, df.salinity_00, label=d.site, c=colours[d.site])
             ax.set_yticks([0, 20, 35])
@@ -0,0 +1,278 @@
+import numpy as np
+import os
+import pandas as pd
+
+from constants import PYRAMID_LEVELS
+
+STATS = ["mean", "std", "min", "max", "count"]
+PARTS = ["count", "mean", "m2", "min", "max"]  # stored per level, mergeable
+META_KEY = "meta"
+DAY = 24 * 3600 * 10**9  # [ns]
+
+
+def _get_origin(t, tz):
+    """
+    Midnight [ns] of the (local) day of t [ns], as resample starts its
+    bins from (UTC for timezone aware indexes, wall time otherwise)
+    """
+    if tz is None:
+        return t - t % DAY
+    return pd.Timestamp(t, tz="UTC").tz_convert(tz).normalize().value
+
+
+def _get_index(t, tz):
+    """ DatetimeIndex of int64 [ns] times t (UTC if tz) """
+    index = pd.to_datetime(np.asarray(t, dtype=np.int64))
+    if tz is not None:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    return index
+
+
+def _get_runs(codes):
+    """ Start positions of runs of equal (sorted) codes, and the end """
+    starts = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    return np.concatenate([[0], starts, [len(codes)]]).astype(np.int64)
+
+
+def _merge(bounds, count, mean, m2, vmin, vmax):
+    """
+    Merge consecutive bins between bounds into one: count, mean, m2 (sum
+    of squared differences from the mean), min and max of each group
+    (parallel algorithm of Chan et al.)
+    """
+    n = len(bounds) - 1
+    ids = np.repeat(np.arange(n), np.diff(bounds))
+    total = np.bincount(ids, weights=count, minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        new_mean = np.bincount(ids, weights=np.where(count > 0,
+                                                     count * mean, 0),
+                               minlength=n) / total
+        delta = np.where(count > 0, mean - new_mean[ids], 0)
+    new_m2 = np.bincount(
+        ids, weights=np.where(count > 0, m2 + count * delta ** 2, 0),
+        minlength=n)
+    starts = bounds[:-1]
+    return (total, new_mean, new_m2,
+            np.fmin.reduceat(vmin, starts), np.fmax.reduceat(vmax, starts))
+
+
+class Pyramid(object):
+    r"""
+    Multi-resolution rollups of a time series frame: count, mean, sum of
+    squared differences from the mean, min and max of each column per
+    bin of each level (resolutions in seconds). Bins are fixed lengths of
+    time from the local midnight of the first row, as pandas resample
+    does, so they are the same across daylight saving changes. Only bins
+    with rows are kept. Any resolution that is a multiple of a level is
+    answered from the coarsest such level (see query) without the source
+    data.
+
+    Parameters
+    ----------
+    levels : dict
+        Resolution [s] to (bin codes, dict of column to 2-D array of
+        PARTS rows)
+    tz : str
+        Timezone of the source index, None if naive
+    meta : dict
+        nrows, first and last [ns] of the source index, origin [ns] of
+        the bins (see _get_origin)
+    """
+
+    def __init__(self, levels, tz, meta):
+        self.levels = levels
+        self.tz = tz
+        self.meta = meta
+
+    @classmethod
+    def build(cls, df, levels=PYRAMID_LEVELS, columns=None):
+        """
+        Pyramid of the (sorted) time indexed df numeric columns: the
+        finest level in one pass over df, each other level merged from
+        the previous one
+        """
+        if columns is None:
+            columns = [c for c in df.columns
+                       if np.issubdtype(df[c].dtype, np.number)]
+        levels = sorted(levels)
+        tz = None if df.index.tz is None else str(df.index.tz)
+        t = df.index.asi8
+        origin = _get_origin(t[0], tz) if len(t) else 0
+        codes = (t - origin) // (levels[0] * 10**9)
+        bounds = _get_runs(codes)
+        starts = bounds[:-1]
+        ids = np.repeat(np.arange(len(starts)), np.diff(bounds))
+        parts = {}
+        for c in columns:
+            x = df[c].values.astype(float)
+            valid = ~np.isnan(x)
+            count = np.bincount(ids, weights=valid, minlength=len(starts))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.bincount(ids, weights=np.where(valid, x, 0),
+                                   minlength=len(starts)) / count
+            m2 = np.bincount(
+                ids, weights=np.where(valid, (x - mean[ids]) ** 2, 0),
+                minlength=len(starts))
+            parts[c] = np.vstack([count, mean, m2,
+                                  np.fmin.reduceat(x, starts),
+                                  np.fmax.reduceat(x, starts)])
+        pyramid = {levels[0]: (codes[starts], parts)}
+        for prev, level in zip(levels[:-1], levels[1:]):
+            prev_codes, prev_parts = pyramid[prev]
+            codes = (prev_codes * prev) // level
+            bounds = _get_runs(codes)
+            pyramid[level] = (
+                codes[bounds[:-1]],
+                {c: np.vstack(_merge(bounds, *p))
+                 for c, p in prev_parts.items()})
+        meta = {"nrows": len(t),
+                "first": int(t[0]) if len(t) else 0,
+                "last": int(t[-1]) if len(t) else 0,
+                "origin": int(origin)}
+        return cls(pyramid, tz, meta)
+
+    def matches(self, index):
+        """ Built from index (same rows, first and last timestamps) """
+        t = index.asi8
+        return (len(t) == self.meta["nrows"] and
+                (not len(t) or (t[0] == self.meta["first"] and
+                                t[-1] == self.meta["last"])))
+
+    def save(self, path):
+        """ Save all levels to a h5 file """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with pd.HDFStore(path, mode="w") as store:
+            for level, (codes, parts) in self.levels.items():
+                data = {"code": codes}
+                for c, p in parts.items():
+                    for j, part in enumerate(PARTS):
+                        data["%s|%s" % (c, part)] = p[j]
+                store.put("level_%d" % level, pd.DataFrame(data))
+            meta = dict(self.meta, tz=self.tz or "")
+            store.put(META_KEY,
+                      pd.DataFrame({k: [v] for k, v in meta.items()}))
+
+    @classmethod
+    def load(cls, path):
+        """ Pyramid saved in path, None if there is none (or too old) """
+        if not os.path.isfile(path):
+            return None
+        levels = {}
+        with pd.HDFStore(path, mode="r") as store:
+            meta = store[META_KEY].iloc[0]
+            for key in store.keys():
+                if not key.startswith("/level_"):
+                    continue
+                df = store[key]
+                parts = {}
+                for name in df.columns[1:]:
+                    c, part = name.rsplit("|", 1)
+                    parts.setdefault(c, np.zeros((len(PARTS), len(df))))
+                    parts[c][PARTS.index(part)] = df[name].values
+                levels[int(key[len("/level_"):])] = (
+                    df["code"].values.astype(np.int64), parts)
+        if "origin" not in meta:  # saved before bins had an origin
+            return None
+        tz = meta["tz"] or None
+        return cls(levels, tz, {k: int(meta[k])
+                                for k in ["nrows", "first", "last",
+                                          "origin"]})
+
+    def get_levels(self, resolution, start=None, end=None):
+        """
+        Levels resolution [s] is a multiple of, with start and end dates
+        on their bins boundaries, coarsest first
+        """
+        origin = self.meta["origin"]
+        dates = [self._get_ns(date) for date in [start, end]
+                 if date is not None]
+        return sorted((level for level in self.levels
+                       if not resolution % level and
+                       not any((t - origin) % (level * 10**9)
+                               for t in dates)),
+                      reverse=True)
+
+    def _get_ns(self, date):
+        """ date as the index int64 [ns] (UTC if timezone aware) """
+        date = pd.Timestamp(date)
+        if date.tz is None and self.tz is not None:
+            date = date.tz_localize(self.tz, ambiguous=False,
+                                    nonexistent="shift_forward")
+        elif date.tz is not None and self.tz is None:
+            date = date.tz_localize(None)
+        return date.value
+
+    def query(self, resolution, start=None, end=None, stat="mean",
+              columns=None):
+        """
+        Statistics (one of STATS, or a list of them) of the rows from
+        start to end (end excluded) per bin of resolution [s], same as
+        df[start:end].resample(resolution).agg(stat) would give (empty
+        bins included). Taken from the coarsest level that fits
+        (see get_levels) and whose bins start on bins from the local
+        midnight of the first row (not the case of days across daylight
+        saving changes), None if no level does.
+        """
+        origin = self.meta["origin"]
+        for level in self.get_levels(resolution, start, end):
+            step = level * 10**9
+            codes, parts = self.levels[level]
+            first, last = 0, len(codes)
+            if start is not None:
+                first = np.searchsorted(
+                    codes, (self._get_ns(start) - origin) // step)
+            if end is not None:
+                last = np.searchsorted(
+                    codes, (self._get_ns(end) - origin) // step)
+            codes = codes[first:last]
+            # bins of resolution from the midnight of the first row
+            start_day = origin
+            if len(codes):
+                start_day = _get_origin(origin + codes[0] * step, self.tz)
+            if (start_day - origin) % step:
+                continue
+            break
+        else:
+            return None
+        if columns is None:
+            columns = list(parts.keys())
+        parts = {c: parts[c][:, first:last] for c in columns}
+        codes = (origin - start_day + codes * step) // (resolution * 10**9)
+        if resolution != level:
+            bounds = _get_runs(codes)
+            parts = {c: _merge(bounds, *p) for c, p in parts.items()}
+            codes = codes[bounds[:-1]]
+        # empty bins between the first and last ones, as resample
+        full = (np.arange(codes[0], codes[-1] + 1) if len(codes) else
+                np.array([], dtype=np.int64))
+        pos = np.searchsorted(full, codes)
+        stats = [stat] if isinstance(stat, str) else list(stat)
+        data = {}
+        for c in columns:
+            count, mean, m2, vmin, vmax = parts[c]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = {
+                    "count": count,
+                    "mean": np.where(count > 0, mean, np.nan),
+                    "std": np.where(count > 1,
+                                    np.sqrt(m2 / (count - 1)), np.nan),
+                    "min": vmin,
+                    "max": vmax}
+            for s in stats:
+                column = np.full(len(full), 0 if s == "count" else np.nan)
+                column[pos] = values[s]
+                data[c if isinstance(stat, str) else (c, s)] = column
+        index = _get_index(start_day + full * resolution * 10**9, self.tz)
+        df = pd.DataFrame(data, index=index)
+        if not isinstance(stat, str):
+            df.columns = pd.MultiIndex.from_tuples(df.columns)
+        return df
+
+    def __str__(self):
+        return "Pyramid of levels %s" % ", ".join(
+            "%ds" % level for level in sorted(self.levels))
+
+    def unicode(self):
+        return self.__str__()
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+
+from constants import DEVICE_MEMORY_BUDGET
+
+
+def get_memory(df):
+    """ Memory used by a pandas.DataFrame (index included) [bytes] """
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DeviceRegistry(object):
+    r"""
+    Process-wide registry of Device objects, one per site, type, format
+    (and start, end, columns projection), so each data file is read once
+    per run however many times a device is asked for.
+
+    Devices are kept in least recently used order. Once raw data is
+    loaded (see Device.df) the memory used by all devices is checked and
+    raw frames of the least recently used devices are released until it
+    fits in budget. Released frames are read again on next access,
+    averaged data is always kept.
+
+    Parameters
+    ----------
+    budget : int
+        Memory [bytes] devices data may use, no limit if None
+    """
+
+    def __init__(self, budget=DEVICE_MEMORY_BUDGET):
+        self.budget = budget
+        self.devices = OrderedDict()
+
+    def get(self, key, factory):
+        """
+        Device of key, created by factory() if not registered yet
+        """
+        if key in self.devices:
+            self.devices.move_to_end(key)
+            return self.devices[key]
+        device = factory()
+        device.registry = self
+        self.devices[key] = device
+        return device
+
+    def loaded(self, device):
+        """
+        Raw data of device loaded: most recently used, trim the others
+        """
+        for key, d in self.devices.items():
+            if d is device:
+                self.devices.move_to_end(key)
+                break
+        self.trim(keep=device)
+
+    def get_usage(self):
+        """ Memory used by raw and averaged data of all devices [bytes] """
+        return sum(get_memory(d._df) + get_memory(d._df_avg)
+                   for d in self.devices.values())
+
+    def trim(self, keep=None):
+        """
+        Release raw frames, least recently used devices first, until
+        memory used fits in budget. Device keep is never released.
+        Returns the number of frames released.
+        """
+        if self.budget is None:
+            return 0
+        usage = self.get_usage()
+        released = 0
+        for d in list(self.devices.values()):
+            if usage <= self.budget:
+                break
+            if d is keep or d._df is None:
+                continue
+            usage -= get_memory(d._df)
+            d.release_df()
+            released += 1
+        return released
+
+    def remove(self, key):
+        """ Forget device of key """
+        device = self.devices.pop(key, None)
+        if device is not None:
+            device.registry = None
+
+    def clear(self):
+        """ Forget all devices """
+        for key in list(self.devices.keys()):
+            self.remove(key)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __str__(self):
+        budget = ("no budget" if self.budget is None else
+                  "budget %.1f MB" % (self.budget / 1024**2))
+        return "Device registry of %d devices, %.1f MB used, %s" % (
+            len(self.devices), self.get_usage() / 1024**2, budget)
+
+    def unicode(self):
+        return self.__str__()
+
+
+REGISTRY = DeviceRegistry()  # shared by encoder.create_device(s)
@@ -7,7 +7,8 @@ import numpy as np
 import seaborn as sns
 from constants import TIMEZONE, DATES, DATES_FORMAT
 from datetime import datetime
-from tools import plotter
+from functools import lru_cache
+from tools import partitions, plotter
 from matplotlib.ticker import MultipleLocator
 from windrose import plot_windrose
 
@@ -212,7 +213,9 @@ def barplot_wind(df):
     gc.collect()
 
 
-def get_weekly_wind():
+@lru_cache(maxsize=None)
+def _read_wind():
+    """ Experiment wind, read once (see get_wind) """
     df = pd.read_csv(
         WIND_EXPERIMENT_DATA_FILE,
         usecols=["Date(NZST)", "Dir(DegT)", "Speed(m/s)"],
@@ -223,10 +226,12 @@ def get_weekly_wind():
     df["speed"] = df["Speed(m/s)"]
     df["direction"] = df["Dir(DegT)"]
     df.index = df.index.tz_localize(TIMEZONE)
-    return [group for i, group in df.groupby(df.index.week)]
+    return df
 
 
-def get_weekly_rainfall():
+@lru_cache(maxsize=None)
+def _read_rainfall():
+    """ Experiment rainfall, read once (see get_rainfall) """
     df = pd.read_csv(
         RAINFALL_EXP_DATA_FILE,
         usecols=["Date(NZST)", "Amount(mm)"],
@@ -236,10 +241,12 @@ def get_weekly_rainfall():
         na_values=["", "-"])
     df["amount"] = df["Amount(mm)"]
     df.index = df.index.tz_localize(TIMEZONE)
-    return [group for i, group in df.groupby(df.index.week)]
+    return df
 
 
-def get_weekly_pressure():
+@lru_cache(maxsize=None)
+def _read_pressure():
+    """ Atmospheric pressure during the experiment, read once """
     df = pd.read_csv(
         PRESSURE_DATA_FILE,
         usecols=["Date(NZST)", "Time(NZST)", "Pmsl(hPa)"],
@@ -250,90 +257,74 @@ def get_weekly_pressure():
     df = df[(df.date >= DATES["start"]) & (df.date <= DATES["end"])]
     df = df.set_index("date")
     df.index = df.index.tz_localize(TIMEZONE)
-    return [group for i, group in df.groupby(df.index.week)]
+    return df
+
+
+@lru_cache(maxsize=None)
+def _read_river(name):
+    """ Hourly flow of river name during the experiment, read once """
+    df = pd.read_csv(
+        RIVERS[name],
+        usecols=["Date", "Time", "Flow"],
+        parse_dates={"date": ["Date", "Time"]},
+        date_parser=lambda d: pd.datetime.strptime(d, '%d/%m/%Y %H:%M:%S'),
+        na_values=["GAP"])
+    df = df.set_index("date")
+    df.index = df.index.tz_localize(TIMEZONE)
+    df = df[(df.index >= DATES["start"]) & (df.index <= DATES["end"])]
+    return df.resample("1h").mean()
+
+
+def get_weekly_wind():
+    return [group for i, group in partitions.split(_read_wind(), "week")]
+
+
+def get_weekly_rainfall():
+    return [group for i, group in partitions.split(_read_rainfall(), "week")]
+
+
+def get_weekly_pressure():
+    return [group for i, group in partitions.split(_read_pressure(), "week")]
 
 
 def get_weekly_rivers():
     rivers = {}
-    for k, v in RIVERS.items():
-        df = pd.read_csv(
-            v,
-            usecols=["Date", "Time", "Flow"],
-            parse_dates={"date": ["Date", "Time"]},
-            date_parser=lambda d: pd.datetime.strptime(d, '%d/%m/%Y %H:%M:%S'),
-            na_values=["GAP"])
-        df = df.set_index("date")
-        df.index = df.index.tz_localize(TIMEZONE)
-        df = df[(df.index >= DATES["start"]) & (df.index <= DATES["end"])]
-        df = df.resample("1h").mean()
-        rivers[k] = [group for i, group in df.groupby(df.index.week)]
+    for k in RIVERS.keys():
+        rivers[k] = [group for i, group in
+                     partitions.split(_read_river(k), "week")]
     return rivers
 
 
 def get_rivers(start=None, end=None):
     rivers = {}
-    for k, v in RIVERS.items():
-        df = pd.read_csv(
-            v,
-            usecols=["Date", "Time", "Flow"],
-            parse_dates={"date": ["Date", "Time"]},
-            date_parser=lambda d: pd.datetime.strptime(d, '%d/%m/%Y %H:%M:%S'),
-            na_values=["GAP"])
-        df = df.set_index("date")
-        df.index = df.index.tz_localize(TIMEZONE)
-        df = df[(df.index >= DATES["start"]) & (df.index <= DATES["end"])]
-        df = df.resample("1h").mean()
+    for k in RIVERS.keys():
+        df = _read_river(k)
         if start is not None and end is not None:
             df = df[(df.index >= start) & (df.index < end)]
-        rivers[k] = df
+        rivers[k] = df.copy()
     return rivers
 
 
 def get_wind(start=None, end=None):
-    df = pd.read_csv(
-        WIND_EXPERIMENT_DATA_FILE,
-        usecols=["Date(NZST)", "Dir(DegT)", "Speed(m/s)"],
-        index_col=0,
-        parse_dates=["Date(NZST)"],
-        date_parser=lambda d: pd.datetime.strptime(d, '%d/%m/%Y %H:%M'),
-        na_values=["", "-"])
-    df["speed"] = df["Speed(m/s)"]
-    df["direction"] = df["Dir(DegT)"]
-    df.index = df.index.tz_localize(TIMEZONE)
+    df = _read_wind()
     if start is not None and end is not None:
         return df[(df.index >= start) & (df.index <= end)]
     else:
-        return df
+        return df.copy()
 
 
 def get_rainfall(start=None, end=None):
-    df = pd.read_csv(
-        RAINFALL_EXP_DATA_FILE,
-        usecols=["Date(NZST)", "Amount(mm)"],
-        index_col=0,
-        parse_dates=["Date(NZST)"],
-        date_parser=lambda d: pd.datetime.strptime(d, '%d/%m/%Y %H:%M'),
-        na_values=["", "-"])
-    df["amount"] = df["Amount(mm)"]
-    df.index = df.index.tz_localize(TIMEZONE)
+    df = _read_rainfall()
     if start is not None and end is not None:
         return df[(df.index >= start) & (df.index < end)]
     else:
-        return df
+        return df.copy()
 
 
 def get_pressure(start=None, end=None):
-    df = pd.read_csv(
-        PRESSURE_DATA_FILE,
-        usecols=["Date(NZST)", "Time(NZST)", "Pmsl(hPa)"],
-        parse_dates={"date": ["Date(NZST)", "Time(NZST)"]},
-        date_parser=lambda d: pd.datetime.strptime(d, '%d/%m/%Y %H:%M'),
-        na_values=["", "-"])
-    df["Atmospheric pressure"] = df["Pmsl(hPa)"]
-    df = df[(df.date >= DATES["start"]) & (df.date <= DATES["end"])]
-    df = df.set_index("date")
-    df.index = df.index.tz_localize(TIMEZONE)
+    df = _read_pressure()
     if start is not None and end is not None:
         return df[(df.index >= start) & (df.index < end)]
     else:
-        return df
+        return df.copy()
+
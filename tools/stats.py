@@ -2,40 +2,123 @@ import numpy as np
 import pandas as pd
 
 from constants import INST_TYPES
-from tools import encoder
+from tools import encoder, masks, partitions
 
 
-def basic_stats():
+# (column, table name, lower bound of the values kept (excluded) or None,
+# bedframes only, decimals)
+STATS_VARS = [
+    ("depth_00", "depth [m]", None, False, 2),
+    ("H", "Sig. Wave Height [m]", 0, True, 2),
+    ("T", "Peak period [s]", 0, True, 2),
+    ("u", "Orb. Vel. [cm/s]", 0, True, 2),
+    ("ssc", "SSC [mg/l]", 0.01, False, 4)]
+WET_DEPTH = 0.025  # [m] time in the water, depth over it
+GROUPS = ["tide", "storm", "calm", "week"]  # basic_stats by
+
+
+def get_groups(d, by):
+    """
+    Group of each averaged row of device d by tide ("Ebb"/"Flood"), storm
+    or calm interval (its start date, see tools.masks) or ISO week.
+    Returns (keys, mask of the rows in a group).
+    """
+    index = d.df_avg.index
+    if by == "tide":
+        keys = np.asarray(d.df_avg["Tide"].astype(object))
+        return keys, pd.notnull(keys)
+    elif by == "week":
+        calendar = partitions.get_calendar(index)
+        return (np.repeat(calendar.weeks, np.diff(calendar.week_bounds)),
+                np.ones(len(index), dtype=bool))
+    if str(d) not in masks.INTERVALS[by]:
+        return np.zeros(len(index)), np.zeros(len(index), dtype=bool)
+    tz = None if index.tz is None else str(index.tz)
+    starts, _ = masks.get_boundaries(by, str(d), tz)
+    keys = pd.to_datetime(starts)
+    if tz is not None:  # starts in UTC
+        keys = keys.tz_localize("UTC").tz_convert(tz)
+    ids = masks.get_interval_ids(index, by, str(d))
+    return keys.take(np.maximum(ids, 0)), ids >= 0
+
+
+def basic_stats(by=None):
     """
-    Basic stats for set of concerto instruments
+    Basic stats for set of concerto instruments, from their averaged data
+    only (raw data is not read), all devices in one grouped pass.
+    One row per device, or per device and group if by (one of GROUPS).
     """
     devs = []
     for t in INST_TYPES:  # all instruments
-        for d in encoder.create_devices_by_type(t, "h5"):
-            devs.append(d)
-    index = [str(d) for d in devs]
-    depth_cols = ["Mean depth [m]", "Max depth [m]", "Min depth [m]"]
-    wave_cols = ["Mean Sig. Wave Height [m]", "Max Sig. Wave Height [m]",
-                 "Min Sig. Wave Height [m]"]
-    period_cols = ["Mean Peak period [s]", "Max Peak period [s]",
-                   "Min Peak period [s]"]
-    u_cols = ["Mean Orb. Vel. [cm/s]", "Max Orb. Vel. [cm/s]",
-              "Min Orb. Vel. [cm/s]"]
-    ssc_cols = ["Mean SSC [mg/l]", "Max SSC [mg/l]", "Min SSC [mg/l]"]
-    columns = (["Site", "Type"] + depth_cols + wave_cols + period_cols + u_cols
-               + ssc_cols + ["% Time in the water"])
-    dfstats = pd.DataFrame(index=index, columns=columns)
-
+        devs.extend(encoder.create_devices_by_type(t, "h5"))
+    frames = []
     for d in devs:
-        dfstats.loc[str(d), ["Site", "Type"]] = (d.site, d.dtype)
-        dfstats.loc[str(d), depth_cols] = d.get_depth_stats()
-        if d.dtype == "bedframe":
-            dfstats.loc[str(d), wave_cols] = d.get_wave_stats()
-            dfstats.loc[str(d), period_cols] = d.get_period_stats()
-            dfstats.loc[str(d), u_cols] = d.get_u_stats()
-        else:
-            dfstats.loc[str(d), wave_cols] = [np.nan, np.nan, np.nan]
-            dfstats.loc[str(d), u_cols] = [np.nan, np.nan, np.nan]
-        dfstats.loc[str(d), ssc_cols] = d.get_ssc_stats()
-        dfstats.loc[str(d), ["% Time in the water"]] = d.get_time_stats()
+        df = d.df_avg
+        data = {"Device": np.repeat(str(d), len(df))}
+        for c, _, low, bedframe, _ in STATS_VARS:
+            if c not in df.columns or (bedframe and d.dtype != "bedframe"):
+                data[c] = np.full(len(df), np.nan)
+                continue
+            values = df[c].values.astype(float)
+            if low is not None:
+                with np.errstate(invalid="ignore"):
+                    values = np.where(values > low, values, np.nan)
+            data[c] = values
+        with np.errstate(invalid="ignore"):
+            data["wet"] = df["depth_00"].values > WET_DEPTH
+        frame = pd.DataFrame(data)
+        if by is not None:
+            keys, mask = get_groups(d, by)
+            frame["group"] = keys
+            frame = frame[mask]
+        frames.append(frame)
+    df = pd.concat(frames, ignore_index=True)
+    df["Device"] = pd.Categorical(df["Device"],
+                                  categories=[str(d) for d in devs])
+    keys = ["Device"] if by is None else ["Device", "group"]
+    grouped = df.groupby(keys, sort=True, observed=True)
+    agg = grouped[[c for c, _, _, _, _ in STATS_VARS]].agg(
+        ["mean", "max", "min"])
+    columns = {}
+    for c, name, _, _, decimals in STATS_VARS:
+        for stat in ["mean", "max", "min"]:
+            columns["%s %s" % (stat.capitalize(), name)] = agg[
+                (c, stat)].round(decimals)
+    columns["% Time in the water"] = (grouped["wet"].mean() * 100).round(2)
+    dfstats = pd.DataFrame(columns).reset_index()
+    devices = {str(d): d for d in devs}
+    dfstats.insert(1, "Site", [devices[n].site for n in dfstats["Device"]])
+    dfstats.insert(2, "Type", [devices[n].dtype for n in dfstats["Device"]])
+    if by is not None:
+        dfstats.insert(3, by.capitalize(), dfstats.pop("group"))
+    dfstats.index = dfstats.pop("Device").astype(str).values
     return dfstats
+
+
+def memory_report(dformat="h5", compact=True):
+    """
+    Memory used by raw and averaged data of every device [MB], with
+    float64/object columns and as loaded (compact mode if compact)
+    """
+    columns = ["Site", "Type", "Raw [MB]", "Raw compact [MB]",
+               "Avg [MB]", "Avg compact [MB]", "Saved [MB]", "Saved [%]"]
+    rows = []
+    for t in INST_TYPES:
+        for d in encoder.create_devices_by_type(t, dformat, shared=False,
+                                                compact=compact):
+            report = d.get_memory_report()
+            full = report.get("raw_full", 0) + report.get("avg_full", 0)
+            used = report.get("raw", 0) + report.get("avg", 0)
+            rows.append([
+                d.site,
+                d.dtype,
+                report.get("raw_full", 0) / 1024**2,
+                report.get("raw", 0) / 1024**2,
+                report.get("avg_full", 0) / 1024**2,
+                report.get("avg", 0) / 1024**2,
+                (full - used) / 1024**2,
+                (full - used) / full * 100 if full else np.nan])
+            # one device in memory at a time
+            d.release_df()
+            d.df_avg = None
+    return pd.DataFrame(rows, columns=columns).round(2)
@@ -0,0 +1,179 @@
+import itertools
+import os
+import pandas as pd
+import pyrsktools
+
+CHUNKSIZE = 500000  # rows written/read at once
+
+
+def write_table(path, df, key="df", append=False, chunksize=CHUNKSIZE):
+    """
+    Write df into a chunked, queryable (table format) HDF5 store,
+    chunksize rows at a time. The index is indexed once all rows are in.
+    """
+    append_chunks(path,
+                  (df.iloc[i:i + chunksize]
+                   for i in range(0, len(df), chunksize)),
+                  key=key,
+                  append=append)
+
+
+def append_chunks(path, chunks, key="df", append=False):
+    """
+    Write each pandas.DataFrame of chunks (any iterable, e.g. iter_rsk)
+    into a table format HDF5 store, one at a time. The index is indexed
+    once all rows are in. Returns the number of rows written.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    nrows = 0
+    with pd.HDFStore(path, mode="a" if append else "w") as store:
+        for chunk in chunks:
+            store.append(key, chunk, format="table", index=False)
+            nrows += len(chunk)
+        if key in store:
+            store.create_table_index(key, columns=["index"], optlevel=9,
+                                     kind="full")
+    return nrows
+
+
+def is_table(path, key="df"):
+    """ HDF5 store in path has key in table format (see write_table) """
+    with pd.HDFStore(path, mode="r") as store:
+        return key in store and store.get_storer(key).is_table
+
+
+def get_bounds(path, key="df"):
+    """
+    Number of rows, first and last int64 [ns] timestamps of a HDF5 store,
+    only its index read
+    """
+    with pd.HDFStore(path, mode="r") as store:
+        storer = store.get_storer(key)
+        if storer.is_table:
+            nrows = storer.nrows
+            if not nrows:
+                return 0, 0, 0
+            t = [store.select(key, start=i, stop=i + 1).index.asi8[0]
+                 for i in [0, nrows - 1]]
+        else:
+            index = storer.read_index("axis1")
+            nrows = len(index)
+            if not nrows:
+                return 0, 0, 0
+            t = [index.asi8[0], index.asi8[-1]]
+    return nrows, int(t[0]), int(t[1])
+
+
+def replace_tail(path, df, start, key="df"):
+    """
+    Replace the rows of a table store from start on by the rows of df
+    from start on, the rest of the store kept as it is. If there is no
+    table store in path yet df is written whole (see write_table).
+    Returns the number of rows written.
+    """
+    if not os.path.isfile(path) or not is_table(path, key):
+        write_table(path, df, key)
+        return len(df)
+    start = pd.Timestamp(start)
+    tail = df[df.index >= start]
+    with pd.HDFStore(path, mode="a") as store:
+        store.remove(key, where="index >= start")
+        store.append(key, tail, format="table")
+    return len(tail)
+
+
+def iter_rsk(path, start=None, end=None, tz=None, chunksize=CHUNKSIZE):
+    """
+    Generator of pandas.DataFrame of at most chunksize samples of a RSK
+    file, from start to end dates (only those read from the file).
+    The instruments clock is set to local time, so dates are naive local
+    dates and the timestamp index is localized as tz.
+    """
+    window = {}
+    if start is not None:
+        window["start_time"] = pd.Timestamp(start).tz_localize(
+            "UTC").to_pydatetime()
+    if end is not None:
+        window["end_time"] = pd.Timestamp(end).tz_localize(
+            "UTC").to_pydatetime()
+    rsk = pyrsktools.open(path)
+    try:
+        samples = rsk.samples(**window)
+        while True:
+            rows = list(itertools.islice(samples, chunksize))
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(
+                rows, columns=rsk.sample_fields, index="timestamp")
+            df = df.astype(float)
+            df.index = pd.DatetimeIndex(df.index).tz_convert(None)
+            if tz is not None:
+                df.index = df.index.tz_localize(tz)
+            yield df
+    finally:
+        rsk.close()
+
+
+def get_table_range(path, key="df"):
+    """
+    First and last index values of a table store, without reading it
+    """
+    with pd.HDFStore(path, mode="r") as store:
+        nrows = store.get_storer(key).nrows
+        if not nrows:
+            return None, None
+        first = store.select(key, start=0, stop=1).index[0]
+        last = store.select(key, start=nrows - 1, stop=nrows).index[0]
+    return first, last
+
+
+def select_table(path, start=None, end=None, columns=None, key="df"):
+    """
+    Rows of a table store with index in [start, end), only given columns
+    """
+    where = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        where.append("index >= start")
+    if end is not None:
+        end = pd.Timestamp(end)
+        where.append("index < end")
+    with pd.HDFStore(path, mode="r") as store:
+        return store.select(key, where=" & ".join(where) or None,
+                            columns=columns)
+
+
+def read_hdf(path, columns=None, key="df"):
+    """
+    pandas.DataFrame of a HDF5 store, only given columns. Columns of
+    table format stores are selected on disk, fixed format stores are
+    read whole.
+    """
+    with pd.HDFStore(path, mode="r") as store:
+        if columns is not None and store.get_storer(key).is_table:
+            return store.select(key, columns=columns)
+        df = store.select(key)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def iter_windows(path, start, end, freq, columns=None, key="df"):
+    """
+    Generator of (window start, pandas.DataFrame) for consecutive
+    windows of freq seconds from start to end, read one at a time from
+    a table store. Empty windows are skipped.
+    """
+    delta = pd.Timedelta("%ss" % freq)
+    t0 = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    with pd.HDFStore(path, mode="r") as store:
+        while t0 < end:
+            t1 = t0 + delta
+            df = store.select(key, where="index >= t0 & index < t1",
+                              columns=columns)
+            if len(df):
+                yield t0, df
+            t0 = t1
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+SMOOTH = "1h"  # centred moving average before looking for turning points
+MIN_RANGE = 0.1  # [m] smaller rises/falls between turning points ignored
+TIDE_COLUMNS = ["Tide", "tidal_cycle", "hw_hours"]
+
+
+def smooth(values, window):
+    """
+    Centred moving average of values over window samples, NaN ignored
+    (NaN only where the whole window is)
+    """
+    values = np.asarray(values, dtype=float)
+    if window < 2:
+        return values
+    valid = ~np.isnan(values)
+    sums = np.concatenate([[0], np.cumsum(np.where(valid, values, 0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    n = len(values)
+    first = np.clip(np.arange(n) - window // 2, 0, n)
+    last = np.clip(first + window, 0, n)
+    total = counts[last] - counts[first]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0,
+                        (sums[last] - sums[first]) / total,
+                        np.nan)
+
+
+def get_window(index, freq=SMOOTH):
+    """ Number of samples of index (DatetimeIndex) in freq """
+    if len(index) < 2:
+        return 1
+    step = np.median(np.diff(index.asi8))
+    return max(1, int(round(pd.Timedelta(freq).value / step)))
+
+
+def get_trend(values):
+    """
+    Sign of the slope towards the next sample (+1 rising, -1 falling),
+    flat or NaN slopes taking the last known sign and the last sample
+    the slope from the previous one. +1 if the series never changes.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return np.ones(len(values), dtype=np.int8)
+    with np.errstate(invalid="ignore"):
+        slope = np.sign(np.diff(values))
+    slope = np.append(slope, slope[-1])
+    known = ~np.isnan(slope) & (slope != 0)
+    # forward fill known signs, backward fill the head
+    last = np.maximum.accumulate(np.where(known, np.arange(len(slope)), -1))
+    if not known.any():
+        return np.ones(len(values), dtype=np.int8)
+    last[last < 0] = np.flatnonzero(known)[0]
+    return slope[last].astype(np.int8)
+
+
+def get_turning_points(values, trend, min_range=MIN_RANGE):
+    """
+    Positions of high waters (trend rising to falling) and low waters
+    (falling to rising) of values, alternating. Rises or falls smaller
+    than min_range (e.g. waves, noise) are not turning points: of
+    consecutive turning points of a kind the highest high water or
+    lowest low water is kept.
+    """
+    change = np.flatnonzero(trend[1:] != trend[:-1]) + 1
+    high = trend[change] < 0
+    keep = []
+    for j, p in enumerate(change):
+        if np.isnan(values[p]):
+            continue
+        if keep and high[keep[-1]] == high[j]:
+            last = change[keep[-1]]
+            if (values[p] > values[last]) == high[j]:
+                keep[-1] = j
+        elif not keep or abs(
+                values[p] - values[change[keep[-1]]]) >= min_range:
+            keep.append(j)
+    keep = np.array(keep, dtype=np.int64)
+    points = change[keep]
+    return points[high[keep]], points[~high[keep]]
+
+
+def get_tidal_columns(index, depth, freq=SMOOTH):
+    """
+    Tidal phase of a depth series (DatetimeIndex index), in vectorized
+    passes over the whole series, depth smoothed over freq first:
+    Tide "Ebb"/"Flood" (from high to low water / low to high water,
+    before the first turning point as the trend), tidal_cycle (number of
+    the low water to low water cycle, 0 before the first low water) and
+    hw_hours (signed hours from the high water of the cycle, NaN if the
+    cycle has none e.g. the ends of the series).
+    Returns a dict of arrays.
+    """
+    values = smooth(depth, get_window(index, freq))
+    trend = get_trend(values)
+    high, low = get_turning_points(values, trend)
+    positions = np.arange(len(trend))
+    cycle = np.searchsorted(low, positions, side="right")
+    # falling since the last high water if it is after the last low water,
+    # position -1 if none
+    last_high = np.append(high, -1)[
+        np.searchsorted(high, positions, side="right") - 1]
+    last_low = np.append(low, -1)[cycle - 1]
+    falling = np.where((last_high < 0) & (last_low < 0),
+                       trend < 0,
+                       last_high > last_low)
+    t = index.asi8
+    hw = np.full(len(low) + 1, np.nan)
+    hw[cycle[high]] = t[high]
+    with np.errstate(invalid="ignore"):
+        hours = (t - hw[cycle]) / (3600 * 10**9)
+    return {
+        "Tide": np.where(falling, "Ebb", "Flood"),
+        "tidal_cycle": cycle.astype(np.int64),
+        "hw_hours": hours}
+
+
+def set_tidal_columns(df, depth="depth_00", freq=SMOOTH, force=False):
+    """
+    Add (cache) tidal columns (see get_tidal_columns) of df[depth] to df,
+    all of them again if any is missing or force
+    """
+    if not len(df) or (
+            not force and all(c in df.columns for c in TIDE_COLUMNS)):
+        return df
+    columns = get_tidal_columns(df.index, df[depth].values, freq)
+    for c in TIDE_COLUMNS:
+        df[c] = columns[c]
+    return df
+
+
+def update_tidal_columns(df, seam, depth="depth_00", freq=SMOOTH):
+    """
+    Tidal columns of df (see set_tidal_columns) once rows are appended
+    from position seam on: calculated again only from the tidal cycle
+    before the one of the seam (to find its turning points again), rows
+    from the seam cycle on replaced. All calculated if there are no
+    tidal columns before the seam.
+    Returns the position of the first row changed.
+    """
+    if (seam < 1 or any(c not in df.columns for c in TIDE_COLUMNS) or
+            df["tidal_cycle"].iloc[:seam].isnull().any()):
+        set_tidal_columns(df, depth, freq, force=True)
+        return 0
+    cycles = df["tidal_cycle"].values[:seam].astype(np.int64)
+    seam_cycle = cycles[-1]
+    first = np.searchsorted(cycles, seam_cycle - 1)
+    keep = np.searchsorted(cycles, seam_cycle)
+    columns = get_tidal_columns(df.index[first:], df[depth].values[first:],
+                                freq)
+    # cycles numbered from the first row, number them as before
+    offset = seam_cycle - columns["tidal_cycle"][keep - first]
+    columns["tidal_cycle"] = columns["tidal_cycle"] + offset
+    for c in TIDE_COLUMNS:
+        values = np.array(df[c].values, dtype=object if c == "Tide" else float)
+        values[keep:] = columns[c][keep - first:]
+        df[c] = values
+    df["tidal_cycle"] = df["tidal_cycle"].astype(np.int64)
+    return keep
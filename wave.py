@@ -73,15 +73,31 @@ class Wave(object):
             "S%d" % self.site,
             "bedframe", "h5")
 
+    def get_concerto(self, start, end):
+        """
+        Concerto averaged data from start to end (included) averaged
+        every INTERVAL seconds, from its rollups (see
+        Device.get_rollup)
+        """
+        i = "%ds" % self.concerto.i
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        if start.tz is None:
+            start = start.tz_localize(TIMEZONE)
+        if end.tz is None:
+            end = end.tz_localize(TIMEZONE)
+        # averaged rows are every i seconds, bounds on them
+        return self.concerto.get_rollup(
+            INTERVAL, start.ceil(i), end.floor(i) + pd.Timedelta(i),
+            avg=True)
+
     def plot(self):
         sns.set(rc={"figure.figsize": (20, 12)})
         sns.set_style("ticks")
         plotter.set_font_sizes()
-        concerto_df = self.concerto.df_avg
         weeks = self.df.index.week
         for week, df in self.df.groupby(weeks):
-            cdf = concerto_df[
-                    df.index.min():df.index.max()].resample('30Min').mean()
+            cdf = self.get_concerto(df.index.min(), df.index.max())
             fig, axes = plt.subplots(ncols=1, nrows=3,
                                      figsize=(28, 4))
             # water depth
@@ -125,7 +141,7 @@ class Wave(object):
         """
         Plot interval defined by start/end dates
         """
-        cdf = self.concerto.df_avg[start:end].resample('30Min').mean()
+        cdf = self.get_concerto(start, end)
         df = self.df[start:end]
 
         fig, axes = plt.subplots(ncols=1, nrows=3,